@@ -0,0 +1,100 @@
+"""
+adaptive.py
+
+Feedback controller that picks the detection resolution and detector coarseness
+needed to hold a target detection rate on the webcam counters.
+
+How it works (summary):
+  - LEVELS runs from fine (wide frames, small Haar scaleFactor / HOG pyramid step)
+    to coarse (narrow frames, bigger steps). Level 2 is the counters' original
+    640 px / scaleFactor 1.1 / winStride 8 setting.
+  - record() feeds the latency of each detection into a moving average. After
+    `patience` detections over the 1/target_fps budget the controller steps one
+    level coarser. It steps finer when the latency predicted for the finer level
+    (which grows with the pixel count) still leaves headroom. Stepping up needs
+    twice the patience, so the level does not oscillate.
+  - Detectors apply a level through configure(settings) (see detectors.py).
+  - metrics() / format() expose the current settings and achieved FPS for overlays.
+"""
+
+import threading
+from collections import namedtuple
+
+# width: detection frame width in px (never upscaled beyond the source frame)
+# scale_factor: Haar pyramid step; win_stride / hog_scale: HOG window step and pyramid step
+Settings = namedtuple("Settings", ["width", "scale_factor", "win_stride", "hog_scale"])
+
+LEVELS = (
+    Settings(960, 1.05, (8, 8), 1.03),
+    Settings(800, 1.08, (8, 8), 1.05),
+    Settings(640, 1.1, (8, 8), 1.05),
+    Settings(480, 1.15, (8, 8), 1.08),
+    Settings(400, 1.2, (16, 16), 1.1),
+    Settings(320, 1.25, (16, 16), 1.15),
+)
+
+
+class AdaptiveResolution:
+    def __init__(self, target_fps=10.0, levels=LEVELS, start=2, headroom=0.8, patience=5, alpha=0.3):
+        self.target_fps = target_fps
+        self.levels = levels
+        self.level = max(0, min(start, len(levels) - 1))
+        self.headroom = headroom
+        self.patience = patience
+        self.alpha = alpha
+        self.latency = None             # moving average of detection seconds at the current level
+        self.changes = 0
+        self._over = 0
+        self._under = 0
+        self._lock = threading.Lock()
+
+    @property
+    def settings(self):
+        return self.levels[self.level]
+
+    def record(self, seconds):
+        with self._lock:
+            if self.latency is None:
+                self.latency = seconds
+            else:
+                self.latency += self.alpha * (seconds - self.latency)
+            budget = 1.0 / self.target_fps
+
+            finer_ok = False
+            if self.level > 0:
+                growth = (self.levels[self.level - 1].width / self.settings.width) ** 2
+                finer_ok = self.latency * growth < self.headroom * budget
+
+            if self.latency > budget:
+                self._over += 1
+                self._under = 0
+            elif finer_ok:
+                self._under += 1
+                self._over = 0
+            else:
+                self._over = self._under = 0
+
+            if self._over >= self.patience and self.level < len(self.levels) - 1:
+                self._step(+1)
+            elif self._under >= 2 * self.patience:
+                self._step(-1)
+
+    def _step(self, direction):
+        self.level += direction
+        self.changes += 1
+        self.latency = None     # measure the new level from scratch
+        self._over = self._under = 0
+
+    def metrics(self):
+        with self._lock:
+            s = self.settings
+            return {"level": self.level, "width": s.width, "scale_factor": s.scale_factor,
+                    "win_stride": s.win_stride[0], "hog_scale": s.hog_scale,
+                    "latency_ms": (self.latency or 0.0) * 1000,
+                    "fps": 1.0 / self.latency if self.latency else 0.0,
+                    "target_fps": self.target_fps, "changes": self.changes}
+
+    def format(self):
+        m = self.metrics()
+        return (f"detect {m['width']}px sf {m['scale_factor']} stride {m['win_stride']} "
+                f"| {m['fps']:.1f}/{m['target_fps']:.0f} fps")
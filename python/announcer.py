@@ -0,0 +1,102 @@
+"""
+announcer.py
+
+Non-blocking text-to-speech for the webcam counters.
+
+Requirements:
+  pip install pyttsx3
+  (On Linux you may need `espeak` or another TTS backend installed for pyttsx3.)
+
+How it works (summary):
+  - The pyttsx3 engine is created and driven on a dedicated announcer thread;
+    say() only hands the phrase over and returns immediately.
+  - The queue holds a single pending phrase: a new say() replaces a phrase that has
+    not started yet (counted as dropped), so after a burst of count changes only the
+    latest count is spoken.
+  - blocking=True speaks inside say() like the old code did, to compare frame drops.
+  - With a StageStats, the time spent speaking each phrase is recorded as "speak".
+"""
+
+import time
+import threading
+
+
+class Announcer:
+    def __init__(self, configure=None, blocking=False, stats=None):
+        """`configure(engine)` runs once on the TTS thread, e.g. to set the speaking rate."""
+        self.configure = configure
+        self.blocking = blocking
+        self.stats = stats
+        self.spoken = 0
+        self.dropped = 0
+        self._engine = None
+        self._pending = None
+        self._cond = threading.Condition()
+        self._running = True
+        self._thread = None
+        if not blocking:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _make_engine(self):
+        # imported here so headless users of the counters don't need a TTS backend
+        import pyttsx3
+        engine = pyttsx3.init()
+        if self.configure is not None:
+            self.configure(engine)
+        return engine
+
+    def _speak(self, text):
+        t0 = time.perf_counter()
+        try:
+            if self._engine is None:
+                self._engine = self._make_engine()
+            self._engine.say(text)
+            self._engine.runAndWait()
+            self.spoken += 1
+            if self.stats is not None:
+                self.stats.record("speak", time.perf_counter() - t0)
+        except Exception as e:
+            # if TTS fails, just print
+            print("TTS error:", e)
+            print(text)
+
+    def say(self, text):
+        if self.blocking:
+            self._speak(text)
+            return
+        with self._cond:
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = text
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending is not None or not self._running)
+                if not self._running:
+                    break
+                text, self._pending = self._pending, None
+            self._speak(text)
+        if self._engine is not None:
+            try:
+                self._engine.stop()
+            except Exception:
+                pass
+
+    def stop(self):
+        if self._thread is None:
+            if self._engine is not None:
+                try:
+                    self._engine.stop()
+                except Exception:
+                    pass
+            return
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(timeout=1.0)
+
+    def report(self):
+        return f"announcer: spoke {self.spoken}, dropped {self.dropped} stale announcements"
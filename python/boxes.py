@@ -0,0 +1,213 @@
+"""
+boxes.py
+
+Vectorized bounding-box engine for the webcam counters.
+
+Requirements:
+  pip install numpy
+
+How it works (summary):
+  - Boxes are (N, 4) int32 arrays of (x, y, w, h), the format OpenCV detectors return.
+  - iou_matrix() computes all pairwise IoUs in one NumPy broadcast.
+  - union_merge() is the original greedy "merge overlapping boxes into their
+    bounding union" behaviour of people_counter.py, driven by the IoU matrix.
+  - weighted_nms() is score-weighted non-maximum suppression: boxes are visited
+    in descending score order and each kept box becomes the score-weighted average
+    of the boxes it suppresses (HOG returns these scores as `weights`).
+  - scale_boxes() maps boxes between resolutions and roi_crops() turns boxes into
+    padded, merged crops for region-of-interest detection.
+
+Microbenchmark (legacy scalar merge vs vectorized versions at 10/100/1000 boxes):
+  python boxes.py
+"""
+
+import time
+
+import numpy as np
+
+
+def as_boxes(boxes):
+    """Any sequence of (x, y, w, h) as an (N, 4) int32 array."""
+    return np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+
+
+def iou_matrix(boxes):
+    """(N, N) IoU of every pair of (x, y, w, h) boxes."""
+    b = as_boxes(boxes).astype(np.float32)
+    x1, y1 = b[:, 0], b[:, 1]
+    x2, y2 = x1 + b[:, 2], y1 + b[:, 3]
+    # intersection width/height, computed in place to keep temporaries to a minimum
+    inter = np.minimum(x2[:, None], x2[None, :])
+    inter -= np.maximum(x1[:, None], x1[None, :])
+    np.clip(inter, 0, None, out=inter)
+    ih = np.minimum(y2[:, None], y2[None, :])
+    ih -= np.maximum(y1[:, None], y1[None, :])
+    np.clip(ih, 0, None, out=ih)
+    inter *= ih
+    area = b[:, 2] * b[:, 3]
+    union = np.add(area[:, None], area[None, :], out=ih)
+    union -= inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def union_merge(boxes, iou_thresh=0.3):
+    """
+    Greedy clustering: take the first remaining box, absorb every remaining box whose
+    IoU with it exceeds iou_thresh, and output the bounding union of the group.
+    """
+    boxes = as_boxes(boxes)
+    if len(boxes) == 0:
+        return boxes
+    iou = iou_matrix(boxes)
+    x1, y1 = boxes[:, 0], boxes[:, 1]
+    x2, y2 = x1 + boxes[:, 2], y1 + boxes[:, 3]
+    alive = np.ones(len(boxes), dtype=bool)
+    merged = []
+    for i in range(len(boxes)):
+        if not alive[i]:
+            continue
+        group = alive & (iou[i] > iou_thresh)
+        group[i] = True
+        alive &= ~group
+        gx1, gy1 = x1[group].min(), y1[group].min()
+        merged.append((gx1, gy1, x2[group].max() - gx1, y2[group].max() - gy1))
+    return as_boxes(merged)
+
+
+def weighted_nms(boxes, scores, iou_thresh=0.4):
+    """
+    Score-weighted NMS. Returns (boxes, scores): one box per group of overlapping
+    detections, placed at the score-weighted mean of the group's corners and
+    carrying the group's best score.
+    """
+    boxes = as_boxes(boxes)
+    scores = np.asarray(scores, dtype=np.float64).ravel()
+    if len(boxes) == 0:
+        return boxes, scores
+    iou = iou_matrix(boxes)
+    corners = np.column_stack([boxes[:, 0], boxes[:, 1],
+                               boxes[:, 0] + boxes[:, 2], boxes[:, 1] + boxes[:, 3]]).astype(np.float64)
+    alive = np.ones(len(boxes), dtype=bool)
+    kept, kept_scores = [], []
+    for i in np.argsort(-scores, kind="stable"):
+        if not alive[i]:
+            continue
+        group = alive & (iou[i] > iou_thresh)
+        group[i] = True
+        alive &= ~group
+        w = np.clip(scores[group], 0, None)
+        w = w / w.sum() if w.sum() > 0 else np.full(len(w), 1.0 / len(w))
+        cx1, cy1, cx2, cy2 = np.rint(w @ corners[group])
+        kept.append((cx1, cy1, cx2 - cx1, cy2 - cy1))
+        kept_scores.append(scores[i])
+    return as_boxes(kept), np.asarray(kept_scores)
+
+
+def scale_boxes(boxes, scale_x, scale_y):
+    """Map boxes to another resolution by scaling both corners (as face_counter.py draws its detections)."""
+    b = as_boxes(boxes).astype(np.float64)
+    x1 = (b[:, 0] * scale_x).astype(np.int32)
+    y1 = (b[:, 1] * scale_y).astype(np.int32)
+    x2 = ((b[:, 0] + b[:, 2]) * scale_x).astype(np.int32)
+    y2 = ((b[:, 1] + b[:, 3]) * scale_y).astype(np.int32)
+    return np.column_stack([x1, y1, x2 - x1, y2 - y1])
+
+
+def roi_crops(boxes, frame_shape, pad=0.5, min_size=(0, 0)):
+    """
+    Crops (x, y, w, h) covering `boxes`: each box grown by `pad` of its size on every side
+    and to at least min_size (w, h), with overlapping crops merged so no pixel is scanned
+    twice. Crops that stick out of the frame slide back inside it, so boxes at the edges
+    still get min_size crops; None if min_size does not fit in the frame at all.
+    """
+    b = as_boxes(boxes).astype(np.float64)
+    h, w = frame_shape[:2]
+    if min_size[0] > w or min_size[1] > h:
+        return None
+    if len(b) == 0:
+        return as_boxes(b)
+    cx, cy = b[:, 0] + b[:, 2] / 2, b[:, 1] + b[:, 3] / 2
+    bw = np.maximum(b[:, 2] * (1 + 2 * pad), min_size[0])
+    bh = np.maximum(b[:, 3] * (1 + 2 * pad), min_size[1])
+    # shift by the overflow first, then clip whatever is still larger than the frame
+    x1 = np.clip(cx - bw / 2, 0, np.maximum(w - bw, 0))
+    y1 = np.clip(cy - bh / 2, 0, np.maximum(h - bh, 0))
+    x2, y2 = np.minimum(x1 + bw, w), np.minimum(y1 + bh, h)
+    crops = as_boxes(np.rint(np.column_stack([x1, y1, x2 - x1, y2 - y1])))
+    crops = crops[(crops[:, 2] > 0) & (crops[:, 3] > 0)]
+    while True:
+        merged = union_merge(crops, 0.0)
+        if len(merged) == len(crops):
+            return merged
+        crops = merged
+
+
+# ---------- benchmark ----------
+def _legacy_iou(boxA, boxB):
+    # the scalar iou() formerly in people_counter.py
+    xA = max(boxA[0], boxB[0])
+    yA = max(boxA[1], boxB[1])
+    xB = min(boxA[0]+boxA[2], boxB[0]+boxB[2])
+    yB = min(boxA[1]+boxA[3], boxB[1]+boxB[3])
+    interArea = max(0, xB - xA) * max(0, yB - yA)
+    union = boxA[2]*boxA[3] + boxB[2]*boxB[3] - interArea
+    return interArea / union if union > 0 else 0
+
+
+def _legacy_merge(boxes, iou_thresh=0.3):
+    # the list.pop(0) based merge_boxes() formerly in people_counter.py
+    boxes = boxes.copy()
+    merged = []
+    while boxes:
+        base = boxes.pop(0)
+        bx, by, bw, bh = base
+        to_merge = []
+        i = 0
+        while i < len(boxes):
+            if _legacy_iou(base, boxes[i]) > iou_thresh:
+                to_merge.append(boxes.pop(i))
+            else:
+                i += 1
+        xs = [bx, bx + bw]
+        ys = [by, by + bh]
+        for m in to_merge:
+            xs.append(m[0]); xs.append(m[0]+m[2])
+            ys.append(m[1]); ys.append(m[1]+m[3])
+        merged.append((min(xs), min(ys), max(xs)-min(xs), max(ys)-min(ys)))
+    return merged
+
+
+def _random_detections(n, rng):
+    # clusters of jittered boxes, like HOG firing several times on one person
+    people = max(1, n // 5)
+    centres = rng.integers(0, 600, size=(people, 2))
+    pick = rng.integers(0, people, size=n)
+    xy = centres[pick] + rng.integers(-8, 9, size=(n, 2))
+    wh = rng.integers(60, 80, size=(n, 2)) * np.array([1, 2])
+    return np.column_stack([xy, wh]).astype(np.int32), rng.random(n)
+
+
+def _time(fn, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat * 1000
+
+
+def benchmark(sizes=(10, 100, 1000), iou_thresh=0.4):
+    rng = np.random.default_rng(0)
+    print(f"{'boxes':>6} {'legacy ms':>10} {'union ms':>10} {'wnms ms':>10}  outputs")
+    for n in sizes:
+        boxes, scores = _random_detections(n, rng)
+        as_list = [tuple(b) for b in boxes.tolist()]
+        repeat = max(1, 2000 // n)
+        legacy = _time(lambda: _legacy_merge(as_list, iou_thresh), max(1, repeat // 10) if n >= 1000 else repeat)
+        union = _time(lambda: union_merge(boxes, iou_thresh), repeat)
+        wnms = _time(lambda: weighted_nms(boxes, scores, iou_thresh), repeat)
+        same = [tuple(b) for b in union_merge(boxes, iou_thresh).tolist()] == _legacy_merge(as_list, iou_thresh)
+        print(f"{n:>6} {legacy:>10.3f} {union:>10.3f} {wnms:>10.3f}  union==legacy: {same}, "
+              f"{len(weighted_nms(boxes, scores, iou_thresh)[0])} boxes after weighted NMS")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,295 @@
+"""
+camera_server.py
+
+One process counting people on many cameras, with a shared detector pool and a
+local HTTP/JSON endpoint for the counts.
+
+Requirements:
+  pip install opencv-python numpy
+
+How it works (summary):
+  - Every camera gets a capture thread that keeps only its newest frame
+    (frame_pipeline.LatestFrame). Adding a camera costs one thread, not a process.
+  - A shared pool of detection workers (each with its own detectors.py backend,
+    Haar+HOG by default) serves all cameras. A free worker takes the camera with a new
+    frame that was served least recently, so every camera gets an equal share of
+    detector time. With --batch N a worker takes up to N cameras' frames at once and
+    runs them through one detect_batch() call (one forward pass for the SSD backend).
+  - Latency budget: a frame older than `budget` seconds when a worker reaches it is
+    dropped in favour of a newer one, and results that finish after the budget are
+    counted as late. Each camera also has a motion gate (motion_gate.py), so static
+    cameras cost almost nothing. The gate runs outside the shared scheduling lock
+    (under a per-camera lock), so one camera's MOG2 step never holds up the others.
+  - stop() closes the workers' detectors (e.g. PeopleDetector's helper pool).
+  - Per-camera counts and stats are served as JSON:
+      GET /counts          all cameras and the total
+      GET /cameras/<name>  one camera
+
+Run:
+  python camera_server.py 0 front=rtsp://10.0.0.5:554/stream back=recording.mp4 --workers 2 --port 8080
+  python camera_server.py cam1.mp4 cam2.mp4 cam3.mp4 --backend ssd --batch 3
+  curl http://127.0.0.1:8080/counts
+"""
+
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+from detectors import BACKENDS, make_detector
+from frame_pipeline import LatestFrame, StageStats
+from motion_gate import MotionGate
+
+
+class Camera:
+    def __init__(self, name, source, on_frame=None, motion_gate=True):
+        self.name = name
+        self.source = source
+        self.cap = cv2.VideoCapture(int(source) if source.isdigit() else source)
+        self.stats = StageStats()
+        self.frames = LatestFrame(self.cap, self.stats, on_frame=on_frame)
+        self.gate = MotionGate() if motion_gate else None
+        self.gate_lock = threading.Lock()   # two workers may hold frames of the same camera
+        self.claimed = 0                # newest frame seq handed to a worker
+        self.last_served = 0.0
+        # latest result
+        self.count = None
+        self.result_seq = 0
+        self.updated = None             # time.time() of the latest result
+        self.latency = 0.0              # capture -> result seconds of the latest result
+        # counters
+        self.detections = 0
+        self.static = 0
+        self.stale = 0
+        self.late = 0
+
+    @property
+    def opened(self):
+        return self.cap.isOpened()
+
+    def snapshot(self):
+        stages = self.stats.summary()
+        return {
+            "source": self.source,
+            "count": self.count,
+            "updated": self.updated,
+            "age_s": round(time.time() - self.updated, 3) if self.updated else None,
+            "latency_ms": round(self.latency * 1000, 1),
+            "capture_fps": round(stages.get("capture", {}).get("fps", 0.0), 1),
+            "detect_fps": round(stages.get("detect", {}).get("fps", 0.0), 1),
+            "detect_ms": round(stages.get("detect", {}).get("latency_ms", 0.0), 1),
+            "detections": self.detections,
+            "skipped_static": self.static,
+            "dropped_stale": self.stale,
+            "late": self.late,
+            "ended": self.frames.ended,
+        }
+
+
+class CameraServer:
+    def __init__(self, sources, make_detector, workers=2, budget=0.5, motion_gate=True, batch=1):
+        self.make_detector = make_detector
+        self.workers = workers
+        self.batch = max(1, batch)
+        self.budget = budget
+        self._cond = threading.Condition()
+        self._running = False
+        self._threads = []
+        self._detectors = []            # built by the workers, closed by stop()
+        self.cameras = {}
+        for name, source in sources:
+            camera = Camera(name, source, on_frame=self._wake, motion_gate=motion_gate)
+            if not camera.opened:
+                print(f"WARNING: could not open camera {name} ({source})")
+            self.cameras[name] = camera
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify()
+
+    def start(self):
+        self._running = True
+        for camera in self.cameras.values():
+            if camera.opened:
+                camera.frames.start()
+        for _ in range(self.workers):
+            t = threading.Thread(target=self._detect_loop, daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        for camera in self.cameras.values():
+            if camera.opened:
+                camera.frames.stop()
+            camera.cap.release()
+        for t in self._threads:
+            t.join(timeout=1.0)
+        with self._cond:
+            detectors, self._detectors = self._detectors, []
+        for detector in detectors:
+            close = getattr(detector, "close", None)
+            if close is not None:
+                close()
+
+    def _next_job(self, block=True):
+        """
+        (camera, seq, frame, stamp) for the least recently served camera with a new frame
+        that shows motion. None when all cameras have ended, or with block=False when no
+        frame is waiting.
+        """
+        while True:
+            job = self._claim(block)
+            if job is None:
+                return None
+            camera, _, frame, _ = job
+            if camera.gate is not None:
+                # outside self._cond, so the other cameras' capture and workers carry on
+                with camera.gate_lock:
+                    moving = camera.gate(frame)
+                if not moving:
+                    with self._cond:
+                        camera.static += 1
+                    continue
+            return job
+
+    def _claim(self, block):
+        """The scheduling half of _next_job(), under the shared lock; stale frames are skipped."""
+        with self._cond:
+            while self._running:
+                waiting = [c for c in self.cameras.values() if c.opened and c.frames.seq > c.claimed]
+                if not waiting:
+                    if not block:
+                        return None
+                    if all(c.frames.ended or not c.opened for c in self.cameras.values()):
+                        return None
+                    self._cond.wait(timeout=0.5)
+                    continue
+                camera = min(waiting, key=lambda c: c.last_served)
+                seq, frame, stamp = camera.frames.latest()
+                camera.claimed = seq
+                camera.last_served = time.perf_counter()
+                if camera.last_served - stamp > self.budget:
+                    camera.stale += 1
+                    continue
+                return camera, seq, frame, stamp
+        return None
+
+    def _detect_loop(self):
+        detector = self.make_detector()
+        with self._cond:
+            self._detectors.append(detector)
+        while self._running:
+            job = self._next_job()
+            if job is None:
+                return
+            jobs = [job]
+            while len(jobs) < self.batch:
+                job = self._next_job(block=False)
+                if job is None:
+                    break
+                jobs.append(job)
+            t0 = time.perf_counter()
+            results = detector.detect_batch([frame for _, _, frame, _ in jobs])
+            done = time.perf_counter()
+            # per-frame share of the batch
+            elapsed = (done - t0) / len(jobs)
+            for camera, _, _, _ in jobs:
+                if camera.gate is not None:
+                    with camera.gate_lock:
+                        camera.gate.record_detection(elapsed)
+            with self._cond:
+                for (camera, seq, _, stamp), result in zip(jobs, results):
+                    camera.stats.record("detect", elapsed)
+                    camera.detections += 1
+                    if done - stamp > self.budget:
+                        camera.late += 1
+                    # a slower worker may finish an older frame after a newer one
+                    if seq > camera.result_seq:
+                        camera.result_seq = seq
+                        camera.count = result.count
+                        camera.updated = time.time()
+                        camera.latency = done - stamp
+
+    def snapshot(self):
+        with self._cond:
+            cameras = {name: camera.snapshot() for name, camera in self.cameras.items()}
+        total = sum(c["count"] or 0 for c in cameras.values())
+        return {"total": total, "cameras": cameras}
+
+
+# ---------- HTTP ----------
+def make_handler(server):
+    class CountsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") in ("", "/counts"):
+                self._send(200, server.snapshot())
+            elif self.path.startswith("/cameras/"):
+                name = self.path[len("/cameras/"):].rstrip("/")
+                cameras = server.snapshot()["cameras"]
+                if name in cameras:
+                    self._send(200, cameras[name])
+                else:
+                    self._send(404, {"error": f"unknown camera: {name}"})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass    # keep the console for the count summary
+
+    return CountsHandler
+
+
+def parse_sources(specs):
+    """["0", "front=rtsp://..."] -> [("cam0", "0"), ("front", "rtsp://...")]"""
+    sources = []
+    for i, spec in enumerate(specs):
+        name, sep, source = spec.partition("=")
+        if not sep or "://" in name:
+            name, source = f"cam{i}", spec
+        sources.append((name, source))
+    return sources
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Count people on several cameras with one shared detector pool.")
+    parser.add_argument("sources", nargs="+", help="camera index, file or URL, optionally as name=source")
+    parser.add_argument("--workers", type=int, default=2, help="shared detection threads")
+    parser.add_argument("--backend", choices=list(BACKENDS), default="haar+hog", help="detector (detectors.py)")
+    parser.add_argument("--batch", type=int, default=1, help="frames from different cameras per detector call")
+    parser.add_argument("--budget", type=float, default=0.5, help="latency budget in seconds")
+    parser.add_argument("--no-motion-gate", action="store_true", help="detect on static frames too")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    server = CameraServer(parse_sources(args.sources), lambda: make_detector(args.backend, warmup=True),
+                          workers=args.workers, budget=args.budget, motion_gate=not args.no_motion_gate,
+                          batch=args.batch).start()
+    httpd = ThreadingHTTPServer((args.host, args.port), make_handler(server))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    print(f"Serving counts on http://{args.host}:{args.port}/counts (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(5)
+            snap = server.snapshot()
+            print(f"total {snap['total']}: " + ", ".join(f"{name}={c['count']}" for name, c in snap["cameras"].items()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.shutdown()
+        server.stop()
@@ -0,0 +1,241 @@
+"""
+count_events.py
+
+Count events and sampled annotated frames for the counters' headless service mode.
+
+Requirements:
+  pip install opencv-python
+
+How it works (summary):
+  - CountEvents.publish(count, seen, frame) is called once per processed frame. It
+    emits an event only when the count changes, or every `heartbeat` seconds, as one
+    JSON object: {"time", "source", "frame", "count", "seen"}.
+  - Events go to one or more sinks, picked with --events:
+      stdout       one JSON line per event (JSONL), e.g. piped into a log shipper
+      tcp:PORT     JSONL pushed to every client connected to 127.0.0.1:PORT
+                   (clients that stop reading are dropped)
+      http:PORT    GET /count (latest event) and GET /events (recent events) as JSON
+    HOST:PORT works too (tcp:0.0.0.0:9000); the default host is 127.0.0.1.
+  - FrameSampler saves an annotated frame at most every `interval` seconds, so the
+    headless loops only draw boxes on the frames that are written to disk.
+
+Run (see people_counter.py / face_counter.py):
+  python people_counter.py --headless --source rtsp://10.0.0.5:554/stream --events stdout --events http:8081
+  python face_counter.py --headless --events tcp:9000 --save-frames snapshots --save-every 1
+  nc 127.0.0.1 9000
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+
+def parse_address(spec, default_host="127.0.0.1"):
+    """"9000" -> ("127.0.0.1", 9000), "0.0.0.0:9000" -> ("0.0.0.0", 9000)"""
+    host, sep, port = spec.rpartition(":")
+    return (host if sep else default_host), int(port)
+
+
+class JsonlSink:
+    def __init__(self, stream=None):
+        # the real stdout: headless runs send their log prints to stderr
+        self.stream = stream or sys.__stdout__
+
+    def send(self, event):
+        self.stream.write(json.dumps(event) + "\n")
+        self.stream.flush()
+
+    def close(self):
+        pass
+
+
+class TcpSink:
+    """
+    JSONL over TCP to every connected client. Clients that disconnect, or stop reading
+    for `send_timeout` seconds once their socket buffer is full, are dropped.
+    """
+
+    def __init__(self, host, port, send_timeout=0.2):
+        self.server = socket.create_server((host, port))
+        self.send_timeout = send_timeout
+        self.clients = []
+        self._lock = threading.Lock()
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return      # closed
+            # bounds how long a slow reader can hold up send() (and the counter's loop)
+            client.settimeout(self.send_timeout)
+            with self._lock:
+                self.clients.append(client)
+
+    def send(self, event):
+        line = (json.dumps(event) + "\n").encode("utf-8")
+        with self._lock:
+            for client in list(self.clients):
+                try:
+                    client.sendall(line)
+                except OSError:     # disconnected, or socket.timeout: not reading
+                    self.clients.remove(client)
+                    client.close()
+
+    def close(self):
+        self.server.close()
+        with self._lock:
+            for client in self.clients:
+                client.close()
+            self.clients = []
+
+
+class HttpSink:
+    """Latest event at GET /count, the most recent `history` events at GET /events."""
+
+    def __init__(self, host, port, history=100):
+        self.latest = None
+        self.recent = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def send(self, event):
+        with self._lock:
+            self.latest = event
+            self.recent.append(event)
+
+    def _make_handler(self):
+        sink = self
+
+        class EventsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with sink._lock:
+                    latest, recent = sink.latest, list(sink.recent)
+                path = self.path.rstrip("/")
+                if path in ("", "/count"):
+                    self._send(200, latest)
+                elif path == "/events":
+                    self._send(200, recent)
+                else:
+                    self._send(404, {"error": "not found"})
+
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass    # stdout may be carrying the JSONL events
+
+        return EventsHandler
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def make_sink(spec):
+    """Sink for an --events value: "stdout", "tcp:[HOST:]PORT" or "http:[HOST:]PORT"."""
+    kind, _, address = spec.partition(":")
+    if kind == "stdout":
+        return JsonlSink()
+    if kind == "tcp":
+        return TcpSink(*parse_address(address))
+    if kind == "http":
+        return HttpSink(*parse_address(address))
+    raise ValueError(f"unknown event sink {spec!r} (use stdout, tcp:PORT or http:PORT)")
+
+
+class CountEvents:
+    def __init__(self, source, sinks, heartbeat=10.0):
+        self.source = source
+        self.sinks = sinks
+        self.heartbeat = heartbeat
+        self.sent = 0
+        self._last_count = None
+        self._last_time = 0.0
+
+    def publish(self, count, seen=None, frame=None):
+        now = time.time()
+        if count == self._last_count and now - self._last_time < self.heartbeat:
+            return
+        event = {"time": round(now, 3), "source": self.source, "frame": frame, "count": count, "seen": seen}
+        for sink in self.sinks:
+            sink.send(event)
+        self.sent += 1
+        self._last_count = count
+        self._last_time = now
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+    def report(self):
+        return f"events: published {self.sent} count events"
+
+
+class FrameSampler:
+    """Writes at most one annotated frame per `interval` seconds to `directory`."""
+
+    def __init__(self, directory, interval=1.0, prefix="frame"):
+        self.directory = directory
+        self.interval = interval
+        self.prefix = prefix
+        self.saved = 0
+        self._last = None
+        os.makedirs(directory, exist_ok=True)
+
+    def due(self):
+        return self._last is None or time.perf_counter() - self._last >= self.interval
+
+    def save(self, frame):
+        self._last = time.perf_counter()
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.directory, f"{self.prefix}_{stamp}_{self.saved:06d}.jpg")
+        cv2.imwrite(path, frame)
+        self.saved += 1
+        return path
+
+
+def add_headless_arguments(parser):
+    parser.add_argument("--source", default="0", help="camera index, video file or stream URL (default: webcam 0)")
+    parser.add_argument("--headless", action="store_true",
+                        help="no window, no drawing and no speech; publish counts as events instead")
+    parser.add_argument("--events", action="append", metavar="SINK",
+                        help="publish count events to stdout, tcp:[HOST:]PORT or http:[HOST:]PORT "
+                             "(repeatable; --headless defaults to stdout)")
+    parser.add_argument("--heartbeat", type=float, default=10.0,
+                        help="also publish an unchanged count every SECONDS")
+    parser.add_argument("--save-frames", metavar="DIR", help="save sampled annotated frames to DIR")
+    parser.add_argument("--save-every", type=float, default=1.0, metavar="SECONDS",
+                        help="seconds between saved frames")
+
+
+def open_source(source):
+    return cv2.VideoCapture(int(source) if source.isdigit() else source)
+
+
+def events_from_args(args, source):
+    """CountEvents for the parsed options, or None when nothing should be published."""
+    specs = args.events or (["stdout"] if args.headless else [])
+    if not specs:
+        return None
+    return CountEvents(source, [make_sink(spec) for spec in specs], heartbeat=args.heartbeat)
+
+
+def sampler_from_args(args, prefix):
+    if not args.save_frames:
+        return None
+    return FrameSampler(args.save_frames, args.save_every, prefix)
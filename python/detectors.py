@@ -0,0 +1,469 @@
+"""
+detectors.py
+
+Pluggable face / person detector backends for the counters.
+
+Requirements:
+  pip install opencv-python numpy
+  DNN backends need model files in ~/.cache/counter_models (or $COUNTER_MODEL_DIR):
+    ssd   : MobileNetSSD_deploy.prototxt + MobileNetSSD_deploy.caffemodel (Caffe MobileNet-SSD, VOC classes)
+    yunet : face_detection_yunet_2023mar.onnx (from the OpenCV model zoo)
+
+How it works (summary):
+  - Every backend is a Detector: detect(frame) returns a Detection(faces, persons, count)
+    with (N, 4) int32 arrays of (x, y, w, h) boxes in the pixels of the frame it was given, and
+    detect_batch(frames) does the same for several frames (several cameras, or a
+    chunk of a clip) at once.
+  - Backends:
+      haar      : Haar frontal faces (bundled with OpenCV)
+      hog       : HOG+SVM upright persons (bundled with OpenCV)
+      haar+hog  : PeopleDetector, people_counter.py's detector, count = max(faces, persons)
+      ssd       : MobileNet-SSD persons via cv2.dnn, CPU, truly batched (one forward pass per batch)
+      yunet     : YuNet faces via cv2.FaceDetectorYN, CPU
+      ssd+yunet : both DNNs, count = max(faces, persons)
+  - cv2.dnn networks are loaded once per thread and reused by every detector created
+    on that thread; make_detector(..., warmup=True) also runs one dummy inference so
+    the first real frame does not pay for model initialisation.
+  - configure(settings) applies an adaptive.Settings level (Haar scaleFactor, HOG
+    winStride / pyramid scale); backends without such knobs ignore it.
+
+Benchmark (FPS and count accuracy per backend on labelled clips):
+  python detectors.py clip1.mp4 clip2.mp4 --labels labels.csv --backends haar+hog,ssd,ssd+yunet --batch 4
+  labels.csv has the columns source,frame,count (a hand-checked video_batch.py CSV works).
+"""
+
+import os
+import csv
+import time
+import argparse
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from boxes import as_boxes, roi_crops, scale_boxes, union_merge, weighted_nms
+from frame_buffers import FrameBuffers
+from frame_pipeline import StageStats
+
+# Boxes are (N, 4) int32 arrays of (x, y, w, h) in the pixels of the frame given to the detector
+Detection = namedtuple("Detection", ["faces", "persons", "count"])
+NO_BOXES = as_boxes([])
+NO_BOXES.flags.writeable = False
+
+MODEL_DIR = os.environ.get("COUNTER_MODEL_DIR", os.path.join(os.path.expanduser("~"), ".cache", "counter_models"))
+SSD_PROTOTXT = "MobileNetSSD_deploy.prototxt"
+SSD_WEIGHTS = "MobileNetSSD_deploy.caffemodel"
+SSD_PERSON_CLASS = 15
+YUNET_MODEL = "face_detection_yunet_2023mar.onnx"
+# Width PeopleDetector resizes frames to (people_counter.DETECT_WIDTH)
+PEOPLE_WIDTH = 640
+
+_local = threading.local()
+
+
+def model_path(filename):
+    path = os.path.join(MODEL_DIR, filename)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Model file {path} not found. Put it in {MODEL_DIR} or set COUNTER_MODEL_DIR.")
+    return path
+
+
+def cached_model(key, load):
+    """One loaded model per thread and key (OpenCV DNN models must not run on two threads at once)."""
+    models = getattr(_local, "models", None)
+    if models is None:
+        models = _local.models = {}
+    if key not in models:
+        models[key] = load()
+    return models[key]
+
+
+class Detector:
+    name = ""
+
+    def detect(self, frame):
+        raise NotImplementedError
+
+    def detect_batch(self, frames):
+        return [self.detect(frame) for frame in frames]
+
+    def configure(self, settings):
+        pass
+
+    def __call__(self, frame):
+        return self.detect(frame)
+
+
+# --- OpenCV classic ---
+class HaarFaces(Detector):
+    name = "haar"
+
+    def __init__(self, scale_factor=1.1):
+        self.scale_factor = scale_factor
+        self.buffers = FrameBuffers()
+        # Haar cascade for face detection (comes with OpenCV)
+        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+        if self.face_cascade.empty():
+            raise RuntimeError("Failed to load Haar cascade. Check OpenCV installation.")
+
+    def faces(self, gray):
+        faces = self.face_cascade.detectMultiScale(
+            gray,
+            scaleFactor=self.scale_factor,  # how much the image size is reduced at each image scale
+            minNeighbors=5,    # how many neighbors each candidate rectangle should have to retain it
+            minSize=(30, 30)   # minimum size of detected face
+        )
+        return as_boxes(faces)
+
+    def configure(self, settings):
+        self.scale_factor = settings.scale_factor
+
+    def detect(self, frame):
+        faces = self.faces(self.buffers.gray("gray", frame))
+        return Detection(faces, NO_BOXES, len(faces))
+
+
+class HogPersons(Detector):
+    name = "hog"
+
+    def __init__(self, win_stride=(8, 8), scale=1.05):
+        self.win_stride = win_stride
+        self.scale = scale
+        # HOG person detector (works best for standing / upright people)
+        self.hog = cv2.HOGDescriptor()
+        self.hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+
+    def persons(self, image):
+        """Raw HOG boxes and their SVM scores (not merged)."""
+        rects, scores = self.hog.detectMultiScale(image, winStride=self.win_stride, padding=(8, 8), scale=self.scale)
+        return as_boxes(rects), np.ravel(scores)
+
+    def configure(self, settings):
+        self.win_stride = settings.win_stride
+        self.scale = settings.hog_scale
+
+    def detect(self, frame):
+        persons, scores = self.persons(frame)
+        merged, _ = weighted_nms(persons, scores, 0.4)
+        return Detection(NO_BOXES, merged, len(merged))
+
+
+# --- Haar + HOG (people_counter.py) ---
+def merge_boxes(boxes, iou_thresh=0.3, weights=None, method="union"):
+    """
+    Merge overlapping boxes (vectorized, see boxes.py).
+      method="union": greedy clustering into bounding unions (the original behaviour).
+      method="nms":   score-weighted non-maximum suppression using `weights`.
+    """
+    if method == "nms" and weights is not None and len(weights) == len(boxes):
+        merged, _ = weighted_nms(boxes, weights, iou_thresh)
+    else:
+        merged = union_merge(boxes, iou_thresh)
+    return merged
+
+
+def resize_for_detection(frame, width=PEOPLE_WIDTH, buffers=None, name="small"):
+    # Resize to speed up (adjust as needed); into buffers[name] when given
+    if buffers is not None:
+        return buffers.resize(name, frame, width)
+    scale = float(width) / frame.shape[1]
+    return cv2.resize(frame, (width, int(frame.shape[0]*scale)))
+
+
+def iter_crops(image, crops):
+    # (x0, y0, view) for each crop, or the whole image when crops is None
+    if crops is None:
+        yield 0, 0, image
+        return
+    for (x, y, w, h) in crops:
+        yield x, y, image[y:y+h, x:x+w]
+
+
+class PeopleDetector:
+    """
+    Haar face detector + HOG person detector (people_counter.py). Not thread-safe: create
+    one per thread. With concurrent=True the Haar pass runs on a helper thread while HOG
+    runs on the caller's. Boxes are returned in the pixels of a `width`-wide frame.
+    `merge_method` and the roi_* arguments are people_counter.py's MERGE_METHOD / ROI_*.
+    """
+
+    def __init__(self, concurrent=True, controller=None, stats=None, width=PEOPLE_WIDTH, merge_method="nms",
+                 roi_pad=0.5, roi_min_size=(96, 160), roi_max_fraction=0.6):
+        self.haar = HaarFaces()
+        self.hog = HogPersons()
+        self.controller = controller
+        self.width = width
+        self.merge_method = merge_method
+        self.roi_pad = roi_pad
+        self.roi_min_size = roi_min_size
+        self.roi_max_fraction = roi_max_fraction
+        self.stats = stats or StageStats()
+        self.buffers = FrameBuffers()
+        self._pool = ThreadPoolExecutor(max_workers=1) if concurrent else None
+
+    def configure(self, settings):
+        self.haar.configure(settings)
+        self.hog.configure(settings)
+
+    def detect_faces(self, gray, crops=None):
+        # 1) Face detection
+        with self.stats.timer("haar"):
+            if crops is None:
+                return self.haar.faces(gray)
+            faces = [self.haar.faces(image) + (x0, y0, 0, 0) for x0, y0, image in iter_crops(gray, crops)]
+            return as_boxes(np.concatenate(faces)) if faces else NO_BOXES
+
+    def detect_persons(self, frame_small, crops=None):
+        # 2) HOG person detection
+        # returns rects (x, y, w, h) and their SVM weights
+        with self.stats.timer("hog"):
+            if crops is None:
+                return self.hog.persons(frame_small)
+            persons, weights = [], []
+            for x0, y0, image in iter_crops(frame_small, crops):
+                rects, scores = self.hog.persons(image)
+                persons.append(rects + (x0, y0, 0, 0))
+                weights.append(scores)
+            if not persons:
+                return NO_BOXES, np.zeros(0)
+            return as_boxes(np.concatenate(persons)), np.concatenate(weights)
+
+    def crops_for(self, rois, frame, frame_small):
+        """Detection crops in frame_small pixels for full-frame `rois`, or None to scan everything."""
+        if rois is None:
+            return None
+        rois = scale_boxes(rois, frame_small.shape[1] / frame.shape[1], frame_small.shape[0] / frame.shape[0])
+        crops = roi_crops(rois, frame_small.shape, pad=self.roi_pad, min_size=self.roi_min_size)
+        if crops is None:
+            return None     # the frame is smaller than roi_min_size
+        covered = int((crops[:, 2] * crops[:, 3]).sum())
+        if covered > self.roi_max_fraction * frame_small.shape[0] * frame_small.shape[1]:
+            return None
+        return crops
+
+    def __call__(self, frame, rois=None):
+        """Detect on `frame`; if `rois` (full-frame x, y, w, h) are given, only around them."""
+        t0 = time.perf_counter()
+        width = self.width
+        if self.controller is not None:
+            settings = self.controller.settings
+            self.configure(settings)
+            width = min(settings.width, frame.shape[1])
+        with self.stats.timer("detect_resize"):
+            frame_small = resize_for_detection(frame, width, self.buffers)
+            gray = self.buffers.gray("gray", frame_small)
+        crops = self.crops_for(rois, frame, frame_small)
+
+        if self._pool is not None:
+            faces_future = self._pool.submit(self.detect_faces, gray, crops)
+            persons, weights = self.detect_persons(frame_small, crops)
+            faces_list = faces_future.result()
+        else:
+            faces_list = self.detect_faces(gray, crops)
+            persons, weights = self.detect_persons(frame_small, crops)
+
+        # Merge person boxes to avoid double-counting
+        with self.stats.timer("merge"):
+            merged_persons = merge_boxes(persons, iou_thresh=0.4, weights=weights, method=self.merge_method)
+
+        # Heuristic: the estimated count is max(number of unique faces, number of merged person boxes)
+        # (Faces are more precise for seated/talking people; HOG helps detect whole bodies)
+        est_count = max(len(faces_list), len(merged_persons))
+        if width != self.width:
+            to_display = self.width / width
+            faces_list = scale_boxes(faces_list, to_display, to_display)
+            merged_persons = scale_boxes(merged_persons, to_display, to_display)
+        if self.controller is not None:
+            self.controller.record(time.perf_counter() - t0)
+        return Detection(faces_list, merged_persons, est_count)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+
+
+class HaarHog(Detector):
+    name = "haar+hog"
+
+    def __init__(self):
+        self.detector = PeopleDetector()
+
+    def configure(self, settings):
+        self.detector.configure(settings)
+
+    def detect(self, frame):
+        det = self.detector(frame)
+        # PeopleDetector works on a `width`-wide copy
+        scale = frame.shape[1] / self.detector.width
+        return Detection(scale_boxes(det.faces, scale, scale), scale_boxes(det.persons, scale, scale), det.count)
+
+    def close(self):
+        self.detector.close()
+
+
+# --- OpenCV DNN ---
+class SSDPersons(Detector):
+    name = "ssd"
+
+    def __init__(self, confidence=0.5, size=300):
+        self.confidence = confidence
+        self.size = size
+        proto, weights = model_path(SSD_PROTOTXT), model_path(SSD_WEIGHTS)
+
+        def load():
+            net = cv2.dnn.readNetFromCaffe(proto, weights)
+            net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+            return net
+        self.net = cached_model(("ssd", proto, weights), load)
+
+    def detect_batch(self, frames):
+        if not frames:
+            return []
+        blob = cv2.dnn.blobFromImages(frames, 0.007843, (self.size, self.size), 127.5)
+        self.net.setInput(blob)
+        # rows of (image id, class, confidence, x1, y1, x2, y2), coordinates relative
+        out = self.net.forward().reshape(-1, 7)
+        out = out[(out[:, 1] == SSD_PERSON_CLASS) & (out[:, 2] >= self.confidence)]
+        results = []
+        for i, frame in enumerate(frames):
+            h, w = frame.shape[:2]
+            rows = out[out[:, 0] == i]
+            corners = (np.clip(rows[:, 3:7], 0, 1) * np.array([w, h, w, h])).astype(np.int32)
+            corners[:, 2:] -= corners[:, :2]
+            results.append(Detection(NO_BOXES, corners, len(corners)))
+        return results
+
+    def detect(self, frame):
+        return self.detect_batch([frame])[0]
+
+
+class YuNetFaces(Detector):
+    name = "yunet"
+
+    def __init__(self, score_threshold=0.7):
+        path = model_path(YUNET_MODEL)
+        self.model = cached_model(("yunet", path, score_threshold),
+                                  lambda: cv2.FaceDetectorYN.create(path, "", (320, 320), score_threshold))
+
+    def detect(self, frame):
+        # YuNet runs at the frame's own size (no batching: one input size per call)
+        self.model.setInputSize((frame.shape[1], frame.shape[0]))
+        _, faces = self.model.detect(frame)
+        faces = NO_BOXES if faces is None else faces[:, :4].astype(np.int32)
+        return Detection(faces, NO_BOXES, len(faces))
+
+
+class Combined(Detector):
+    """Faces from one detector, persons from another, count = max(faces, persons)."""
+
+    def __init__(self, name, face_detector, person_detector):
+        self.name = name
+        self.face_detector = face_detector
+        self.person_detector = person_detector
+
+    def configure(self, settings):
+        self.face_detector.configure(settings)
+        self.person_detector.configure(settings)
+
+    def detect_batch(self, frames):
+        faces = self.face_detector.detect_batch(frames)
+        persons = self.person_detector.detect_batch(frames)
+        return [Detection(f.faces, p.persons, max(len(f.faces), len(p.persons))) for f, p in zip(faces, persons)]
+
+    def detect(self, frame):
+        return self.detect_batch([frame])[0]
+
+
+BACKENDS = {
+    "haar": HaarFaces,
+    "hog": HogPersons,
+    "haar+hog": HaarHog,
+    "ssd": SSDPersons,
+    "yunet": YuNetFaces,
+    "ssd+yunet": lambda: Combined("ssd+yunet", YuNetFaces(), SSDPersons()),
+}
+
+
+def make_detector(name, warmup=False):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown detector backend: {name} (choose from {', '.join(BACKENDS)})")
+    detector = BACKENDS[name]()
+    if warmup:
+        detector.detect(np.zeros((240, 320, 3), np.uint8))
+    return detector
+
+
+# ---------- benchmark ----------
+def load_labels(path):
+    """{(source, frame): count} from a CSV with source,frame,count columns."""
+    labels = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            labels[(row["source"], int(row["frame"]))] = int(row["count"])
+    return labels
+
+
+def read_clip(path, width, stride, max_frames):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    index = 0
+    while len(frames) < max_frames and cap.grab():
+        if index % stride == 0:
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            if width and frame.shape[1] != width:
+                frame = cv2.resize(frame, (width, int(frame.shape[0] * width / frame.shape[1])))
+            frames.append((index, frame))
+        index += 1
+    cap.release()
+    return frames
+
+
+def benchmark(clips, backends, labels=None, batch=1, width=640, stride=1, max_frames=300):
+    clips = {clip: read_clip(clip, width, stride, max_frames) for clip in clips}
+    labels = labels or {}
+    print(f"{'backend':<10} {'fps':>8} {'ms/frame':>9} {'MAE':>6} {'exact':>6}  labelled frames")
+    for name in backends:
+        try:
+            detector = make_detector(name, warmup=True)
+        except (FileNotFoundError, RuntimeError, cv2.error) as e:
+            print(f"{name:<10} skipped: {e}")
+            continue
+        seconds, frames_done, errors = 0.0, 0, []
+        for clip, frames in clips.items():
+            for start in range(0, len(frames), batch):
+                chunk = frames[start:start + batch]
+                t0 = time.perf_counter()
+                results = detector.detect_batch([frame for _, frame in chunk])
+                seconds += time.perf_counter() - t0
+                frames_done += len(chunk)
+                for (index, _), det in zip(chunk, results):
+                    truth = labels.get((clip, index))
+                    if truth is not None:
+                        errors.append(abs(det.count - truth))
+        fps = frames_done / seconds if seconds else 0.0
+        ms = seconds / frames_done * 1000 if frames_done else 0.0
+        if errors:
+            mae = f"{np.mean(errors):6.2f}"
+            exact = f"{100 * np.mean(np.asarray(errors) == 0):5.0f}%"
+        else:
+            mae, exact = f"{'-':>6}", f"{'-':>6}"
+        print(f"{name:<10} {fps:8.1f} {ms:9.2f} {mae} {exact}  {len(errors)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare detector backends on local video clips.")
+    parser.add_argument("clips", nargs="+")
+    parser.add_argument("--labels", help="CSV with source,frame,count ground truth")
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--batch", type=int, default=1, help="frames per detect_batch call")
+    parser.add_argument("--width", type=int, default=640, help="resize frames to this width first (0 = keep)")
+    parser.add_argument("--stride", type=int, default=1)
+    parser.add_argument("--max-frames", type=int, default=300, help="frames per clip")
+    args = parser.parse_args()
+    benchmark(args.clips, args.backends.split(","), load_labels(args.labels) if args.labels else None,
+              max(1, args.batch), args.width, max(1, args.stride), args.max_frames)
@@ -0,0 +1,189 @@
+"""
+embedding_store.py
+
+Persistent on-disk cache of face embeddings, shared by the face scanners.
+
+Requirements:
+  pip install numpy
+
+How it works (summary):
+  - One SQLite file per scanned folder (<folder>/.face_index.sqlite by default).
+  - Each row is keyed by image path and remembers the file's mtime and size,
+    so a lookup only hits while the file on disk is unchanged.
+  - All face embeddings found in an image are stored as one float32 blob.
+    Images without faces are stored with zero rows so they are not re-scanned.
+  - Rowids only ever grow (the high-water mark is kept in PRAGMA user_version), so
+    (row count, highest rowid) changes on every insert, replace or delete and the
+    IVF index (face_ann.py) can check it is current without reading any embeddings.
+  - If the folder is read-only the index falls back to ~/.cache/face_index/.
+"""
+
+import os
+import sqlite3
+import itertools
+import hashlib
+from pathlib import Path
+
+import numpy as np
+
+INDEX_FILENAME = ".face_index.sqlite"
+SQL_BATCH = 500     # rowids per "IN (...)" query, below SQLite's variable limit
+FALLBACK_DIR = Path.home() / ".cache" / "face_index"
+
+
+def file_key(path):
+    """Return (mtime_ns, size) used to detect changed files."""
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def index_path_for(folder, filename=INDEX_FILENAME):
+    """Pick where the index of `folder` lives: inside it if writable, else in the user cache."""
+    folder = Path(folder)
+    if os.access(folder, os.W_OK):
+        return folder / filename
+    FALLBACK_DIR.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha1(str(folder.resolve()).encode("utf-8")).hexdigest()[:16]
+    return FALLBACK_DIR / f"{digest}{filename}"
+
+
+def cached_lookup(store, path):
+    """Return (path, file key, cached embeddings, None if not cached, or the OSError from stat)."""
+    try:
+        key = file_key(path)
+        embs = store.get(path, *key) if store is not None else None
+        return path, key, embs
+    except OSError as e:
+        return path, None, e
+
+
+class EmbeddingStore:
+    """SQLite table of path -> (mtime, size, embeddings). Use from a single thread."""
+
+    def __init__(self, db_path, dim=128, commit_every=100):
+        self.db_path = str(db_path)
+        self.dim = dim
+        self.commit_every = commit_every
+        self._pending = 0
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS faces ("
+            " path TEXT PRIMARY KEY,"
+            " mtime INTEGER NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " count INTEGER NOT NULL,"
+            " data BLOB NOT NULL)"
+        )
+        # rowids are never reused, even after the highest row is deleted
+        user_version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        max_rowid = self.conn.execute("SELECT MAX(rowid) FROM faces").fetchone()[0] or 0
+        self._last_rowid = max(user_version, max_rowid)
+        self.conn.commit()
+
+    def get(self, path, mtime, size):
+        """Cached embeddings of `path` as a (k, dim) array, or None if missing/stale."""
+        row = self.conn.execute(
+            "SELECT mtime, size, count, data FROM faces WHERE path = ?", (str(path),)
+        ).fetchone()
+        if row is None or row[0] != mtime or row[1] != size:
+            return None
+        return self._decode(row[2], row[3])
+
+    def put(self, path, mtime, size, encodings):
+        """Store the embeddings of `path` (a list or array of dim-sized vectors)."""
+        arr = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        self._last_rowid += 1
+        self.conn.execute(
+            "INSERT OR REPLACE INTO faces (rowid, path, mtime, size, count, data) VALUES (?, ?, ?, ?, ?, ?)",
+            (self._last_rowid, str(path), mtime, size, len(arr), arr.tobytes()),
+        )
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.commit()
+        return arr
+
+    def prune(self, keep_paths):
+        """Delete rows for images that are no longer present. Returns number removed."""
+        keep = set(str(p) for p in keep_paths)
+        stale = [(p,) for (p,) in self.conn.execute("SELECT path FROM faces") if p not in keep]
+        self.conn.executemany("DELETE FROM faces WHERE path = ?", stale)
+        self.commit()
+        return len(stale)
+
+    def load_all(self):
+        """
+        Every stored face as (image paths, owners, matrix): matrix is (N, dim) and
+        owners[i] is the index in `paths` of the image that row i came from.
+        """
+        paths, chunks = [], []
+        for path, count, data in self.conn.execute(
+                "SELECT path, count, data FROM faces WHERE count > 0 ORDER BY path"):
+            paths.append(path)
+            chunks.append(self._decode(count, data))
+        if not chunks:
+            return paths, np.empty(0, dtype=np.int64), np.empty((0, self.dim), dtype=np.float32)
+        owners = np.repeat(np.arange(len(chunks)), [len(c) for c in chunks])
+        return paths, owners, np.vstack(chunks)
+
+    def state(self):
+        """(number of rows, highest rowid): changes whenever a row is inserted, replaced or deleted."""
+        return self.conn.execute("SELECT COUNT(*), IFNULL(MAX(rowid), 0) FROM faces").fetchone()
+
+    def count(self, after=0):
+        """Number of rows (with or without faces) whose rowid is above `after`."""
+        return self.conn.execute("SELECT COUNT(*) FROM faces WHERE rowid > ?", (after,)).fetchone()[0]
+
+    def rowids(self):
+        """Every rowid in the store, sorted."""
+        return np.array([r for (r,) in self.conn.execute("SELECT rowid FROM faces ORDER BY rowid")], dtype=np.int64)
+
+    def load_rows(self, after=0):
+        """Faces of the rows above rowid `after` as (rowids, matrix), one rowid per face."""
+        rowids, chunks = [], []
+        for rowid, count, data in self.conn.execute(
+                "SELECT rowid, count, data FROM faces WHERE rowid > ? AND count > 0 ORDER BY rowid", (after,)):
+            rowids.append(rowid)
+            chunks.append(self._decode(count, data))
+        if not chunks:
+            return np.empty(0, dtype=np.int64), np.empty((0, self.dim), dtype=np.float32)
+        return np.repeat(np.array(rowids, dtype=np.int64), [len(c) for c in chunks]), np.vstack(chunks)
+
+    def load_images(self, rowids):
+        """Like load_all(), but only for the images stored under `rowids`."""
+        paths, chunks = [], []
+        rowids = iter(int(r) for r in np.unique(rowids))
+        while True:
+            batch = list(itertools.islice(rowids, SQL_BATCH))
+            if not batch:
+                break
+            marks = ",".join("?" * len(batch))
+            for path, count, data in self.conn.execute(
+                    f"SELECT path, count, data FROM faces WHERE rowid IN ({marks}) AND count > 0", batch):
+                paths.append(path)
+                chunks.append(self._decode(count, data))
+        if not chunks:
+            return paths, np.empty(0, dtype=np.int64), np.empty((0, self.dim), dtype=np.float32)
+        owners = np.repeat(np.arange(len(chunks)), [len(c) for c in chunks])
+        return paths, owners, np.vstack(chunks)
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM faces").fetchone()[0]
+
+    def commit(self):
+        # persist the rowid high-water mark with the rows that used it
+        self.conn.execute(f"PRAGMA user_version = {int(self._last_rowid)}")
+        self.conn.commit()
+        self._pending = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _decode(self, count, data):
+        return np.frombuffer(data, dtype=np.float32).reshape(count, self.dim)
@@ -0,0 +1,219 @@
+"""
+face_ann.py
+
+Approximate nearest-neighbour (IVF) index over 128-d face embeddings, pure NumPy.
+
+Requirements:
+  pip install numpy
+
+How it works (summary):
+  - k-means splits the embedding matrix into ~sqrt(N) cells ("inverted lists").
+  - A query only looks at the rows of its `nprobe` closest cells, then the exact
+    matcher in face_match.py ranks those candidates. More probes = better recall,
+    fewer probes = faster search.
+  - The index only stores centroids and row ids; vectors stay in the caller's matrix
+    or, for a folder, in its EmbeddingStore (ids are then store rowids, one per face).
+  - load_or_update() keeps the folder index as an .npz next to the embedding index
+    and checks it against the store's (row count, highest rowid), two SQLite
+    aggregates. Faces stored since are added to their nearest existing cell and
+    faces of deleted or replaced images are dropped; k-means only reruns when the
+    index has grown REBUILD_GROWTH times past the size it was trained on.
+
+Benchmark (recall@k against exact search on synthetic clustered embeddings):
+  python face_ann.py --faces 200000 --k 10
+"""
+
+import time
+import argparse
+
+import numpy as np
+
+from face_match import face_distances
+
+ANN_FILENAME = ".face_ivf.npz"
+ANN_MIN_FACES = 5000    # below this, exact search is as fast as probing
+REBUILD_GROWTH = 4      # re-run k-means once the index holds this many times its training size
+
+
+def _kmeans(data, n_lists, iters, rng):
+    centroids = data[rng.choice(len(data), n_lists, replace=False)].copy()
+    for _ in range(iters):
+        assign = face_distances(data, centroids).argmin(axis=1)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=n_lists)
+        filled = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts[filled])[:-1]))
+        sums = np.add.reduceat(data[order], starts, axis=0)
+        centroids[filled] = sums / counts[filled, None]
+        # re-seed empty cells with random points
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty))]
+    return centroids
+
+
+class IVFIndex:
+    def __init__(self, centroids, list_rows, offsets, trained=None, store_state=(0, 0)):
+        self.centroids = centroids      # (L, D) cell centres
+        self.list_rows = list_rows      # row ids grouped by cell
+        self.offsets = offsets          # cell i owns list_rows[offsets[i]:offsets[i+1]]
+        self.trained = len(list_rows) if trained is None else trained   # rows when k-means ran
+        self.store_state = tuple(store_state)   # EmbeddingStore.state() the index is current with
+
+    @classmethod
+    def build(cls, matrix, ids=None, n_lists=None, iters=10, train_per_list=64, seed=0):
+        """Index the rows of `matrix` under `ids` (default: their row numbers)."""
+        matrix = np.asarray(matrix, dtype=np.float32)
+        n = len(matrix)
+        if n == 0:
+            raise ValueError("Cannot build an index over an empty matrix.")
+        if n_lists is None:
+            n_lists = int(np.sqrt(n))
+        n_lists = max(1, min(n_lists, n))
+
+        rng = np.random.default_rng(seed)
+        sample = matrix
+        if n > n_lists * train_per_list:
+            sample = matrix[rng.choice(n, n_lists * train_per_list, replace=False)]
+        centroids = _kmeans(sample, n_lists, iters, rng)
+
+        index = cls(centroids, np.empty(0, dtype=np.int64), np.zeros(n_lists + 1, dtype=np.int64))
+        index.add(matrix, np.arange(n) if ids is None else ids)
+        index.trained = n
+        return index
+
+    def _cells(self):
+        return np.repeat(np.arange(len(self.centroids)), np.diff(self.offsets))
+
+    def _regroup(self, cells, rows):
+        order = np.argsort(cells, kind="stable")
+        self.list_rows = np.asarray(rows, dtype=np.int64)[order]
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(cells, minlength=len(self.centroids)))))
+
+    def add(self, vectors, ids):
+        """File new rows under their nearest existing cell (no re-clustering)."""
+        if len(vectors) == 0:
+            return
+        assign = face_distances(np.asarray(vectors, dtype=np.float32), self.centroids).argmin(axis=1)
+        self._regroup(np.concatenate([self._cells(), assign]), np.concatenate([self.list_rows, ids]))
+
+    def keep(self, mask):
+        """Drop the entries of list_rows where `mask` is False."""
+        self._regroup(self._cells()[mask], self.list_rows[mask])
+
+    def probe(self, refs, nprobe=8):
+        """Row ids in the `nprobe` cells closest to any of `refs` (sorted, unique)."""
+        refs = np.atleast_2d(np.asarray(refs, dtype=np.float32))
+        nprobe = max(1, min(nprobe, len(self.centroids)))
+        dist = face_distances(self.centroids, refs)     # (L, R)
+        if nprobe < len(self.centroids):
+            cells = np.argpartition(dist, nprobe - 1, axis=0)[:nprobe]
+        else:
+            cells = np.broadcast_to(np.arange(len(self.centroids))[:, None], dist.shape)
+        cells = np.unique(cells)
+        parts = [self.list_rows[self.offsets[c]:self.offsets[c + 1]] for c in cells]
+        return np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+    def search(self, matrix, ref, k=10, nprobe=8):
+        """Approximate k nearest rows of `matrix` to a single reference. Returns (ids, distances)."""
+        rows = self.probe(ref, nprobe)
+        dist = face_distances(matrix[rows], ref)[:, 0]
+        top = np.argsort(dist)[:k]
+        return rows[top], dist[top]
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.savez(f, centroids=self.centroids, list_rows=self.list_rows, offsets=self.offsets,
+                     trained=self.trained, store_state=np.array(self.store_state))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["centroids"], data["list_rows"], data["offsets"],
+                       int(data["trained"]), data["store_state"].tolist())
+
+
+def load_or_update(path, store, **build_kwargs):
+    """
+    The IVF index over every face in `store` (ids are store rowids), loaded from `path`
+    and brought up to date with the rows stored since it was saved. Built from the
+    whole store only when there is no usable index yet or it outgrew its training.
+    Returns None if the store holds no faces.
+    """
+    state = store.state()
+    try:
+        index = IVFIndex.load(path)
+    except (OSError, KeyError, ValueError):
+        index = None
+    if index is not None and index.store_state == state:
+        return index
+
+    if index is not None:
+        rows, max_rowid = index.store_state
+        if state[0] - store.count(after=max_rowid) != rows:
+            # some indexed images were deleted or re-encoded since (rowids are never reused)
+            index.keep(np.isin(index.list_rows, store.rowids()))
+        ids, vectors = store.load_rows(after=max_rowid)
+        index.add(vectors, ids)
+        if len(index.list_rows) > REBUILD_GROWTH * index.trained:
+            index = None
+    if index is None:
+        ids, matrix = store.load_rows()
+        if not len(ids):
+            return None
+        index = IVFIndex.build(matrix, ids, **build_kwargs)
+    index.store_state = state
+    try:
+        index.save(path)
+    except OSError:
+        pass    # read-only location: keep the in-memory index
+    return index
+
+
+# ---------- benchmark ----------
+def _synthetic_faces(n, identities, dim=128, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(identities, dim)).astype(np.float32)
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    labels = rng.integers(0, identities, n)
+    faces = centres[labels] + rng.normal(scale=0.03, size=(n, dim)).astype(np.float32)
+    return faces.astype(np.float32)
+
+
+def benchmark(faces=200000, identities=20000, k=10, queries=100, probes=(1, 2, 4, 8, 16, 32)):
+    matrix = _synthetic_faces(faces, identities)
+    rng = np.random.default_rng(1)
+    refs = matrix[rng.choice(faces, queries, replace=False)] + 0.01
+
+    t0 = time.perf_counter()
+    index = IVFIndex.build(matrix)
+    print(f"Built IVF index: {faces} faces, {len(index.centroids)} cells in {time.perf_counter() - t0:.2f}s")
+
+    # what load_or_update() does after a rescan: file new faces, drop removed ones
+    added = _synthetic_faces(faces // 100, identities, seed=2)
+    t0 = time.perf_counter()
+    index.add(added, np.arange(faces, faces + len(added)))
+    index.keep(index.list_rows < faces)
+    print(f"Added and dropped {len(added)} faces in {time.perf_counter() - t0:.2f}s (no re-clustering)")
+
+    t0 = time.perf_counter()
+    exact = [set(np.argsort(face_distances(matrix, r)[:, 0])[:k]) for r in refs]
+    exact_ms = (time.perf_counter() - t0) * 1000 / queries
+    print(f"exact      : {exact_ms:8.2f} ms/query  recall@{k} = 1.000")
+
+    for nprobe in probes:
+        t0 = time.perf_counter()
+        found = [set(index.search(matrix, r, k=k, nprobe=nprobe)[0]) for r in refs]
+        ms = (time.perf_counter() - t0) * 1000 / queries
+        recall = np.mean([len(f & e) / k for f, e in zip(found, exact)])
+        print(f"nprobe={nprobe:<4d}: {ms:8.2f} ms/query  recall@{k} = {recall:.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark IVF search recall/speed against exact search.")
+    parser.add_argument("--faces", type=int, default=200000)
+    parser.add_argument("--identities", type=int, default=20000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+    benchmark(args.faces, args.identities, args.k, args.queries)
@@ -0,0 +1,211 @@
+"""
+face_cluster.py
+
+Unsupervised clustering of every face in the archive into identities.
+
+Requirements:
+  pip install numpy
+
+How it works (summary):
+  - Builds a k-nearest-neighbour graph over all face embeddings: two faces are
+    linked when one is among the other's k nearest and closer than `threshold`.
+    Distances are computed in bounded chunks; with an IVF index (face_ann.py)
+    each face is only compared with faces in nearby cells, so millions of faces scale.
+  - Chinese Whispers label propagation groups the graph into identities
+    (the same algorithm dlib uses for face clustering, vectorized in NumPy).
+  - The result is saved as .face_clusters.npz next to the embedding index, with the
+    store's (row count, highest rowid) and the threshold it was built with.
+    load_clusters() hands it back while the store is unchanged, so looking a person
+    up afterwards is a nearest-centroid lookup, no re-clustering needed.
+
+Run (clusters the embeddings already cached for a folder):
+  python face_cluster.py <folder> --threshold 0.5
+"""
+
+import argparse
+
+import numpy as np
+
+from embedding_store import EmbeddingStore, index_path_for
+from face_ann import ANN_MIN_FACES, IVFIndex
+from face_match import face_distances
+
+CLUSTERS_FILENAME = ".face_clusters.npz"
+MAX_BLOCK_ELEMENTS = 16 * 1024 * 1024     # distance entries computed per chunk
+
+
+def knn_graph(matrix, k=20, threshold=0.5, index=None, nprobe=8):
+    """
+    Undirected edges (src, dst) between faces that are within `threshold` where at least
+    one of the two is among the other's k nearest neighbours (the union of both
+    directions, not a mutual kNN graph). With an IVFIndex the search is approximate.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    n = len(matrix)
+    if index is None:
+        blocks = [(np.arange(n), np.arange(n))]
+    else:
+        blocks = []
+        for c in range(len(index.centroids)):
+            rows = index.list_rows[index.offsets[c]:index.offsets[c + 1]]
+            if len(rows):
+                blocks.append((np.sort(rows), index.probe(index.centroids[c], nprobe)))
+
+    srcs, dsts = [], []
+    for rows, cand in blocks:
+        kk = min(k, len(cand) - 1)
+        if kk <= 0:
+            continue
+        step = max(1, MAX_BLOCK_ELEMENTS // len(cand))
+        cand_vecs = matrix[cand]
+        for start in range(0, len(rows), step):
+            part = rows[start:start + step]
+            d = face_distances(cand_vecs, matrix[part]).T      # (part, cand)
+            # a face is not its own neighbour
+            self_pos = np.searchsorted(cand, part)
+            hit = (self_pos < len(cand)) & (cand[np.minimum(self_pos, len(cand) - 1)] == part)
+            d[np.flatnonzero(hit), self_pos[hit]] = np.inf
+            nearest = np.argpartition(d, kk - 1, axis=1)[:, :kk]
+            close = np.take_along_axis(d, nearest, axis=1) <= threshold
+            srcs.append(np.repeat(part, kk)[close.ravel()])
+            dsts.append(cand[nearest][close])
+
+    if not srcs:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    src, dst = np.concatenate(srcs), np.concatenate(dsts)
+    # make the graph undirected and drop duplicate edges
+    edges = np.unique(np.stack([np.concatenate([src, dst]), np.concatenate([dst, src])], axis=1), axis=0)
+    return edges[:, 0], edges[:, 1]
+
+
+def chinese_whispers(n, src, dst, iterations=30, seed=0):
+    """
+    Label propagation over the graph: every node repeatedly takes the label that is most
+    common among its neighbours. Half of the nodes (at random) update per round, which
+    keeps the vectorized update from oscillating. Returns an int label per node.
+    """
+    labels = np.arange(n)
+    if len(src) == 0:
+        return labels
+    rng = np.random.default_rng(seed)
+    for _ in range(iterations):
+        key = src.astype(np.int64) * n + labels[dst]
+        uniq, counts = np.unique(key, return_counts=True)
+        node, label = uniq // n, uniq % n
+        # best label per node; random jitter breaks ties
+        score = counts + rng.random(len(counts)) * 0.5
+        order = np.lexsort((-score, node))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = node[order[1:]] != node[order[:-1]]
+        best_node, best_label = node[order[first]], label[order[first]]
+
+        update = rng.random(len(best_node)) < 0.5
+        changed = labels[best_node[update]] != best_label[update]
+        labels[best_node[update]] = best_label[update]
+        if not changed.any() and (labels[best_node] == best_label).all():
+            break
+    return labels
+
+
+def _relabel_by_size(labels):
+    """Renumber labels 0..C-1, largest cluster first."""
+    _, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    rank = np.empty(len(counts), dtype=np.int64)
+    rank[np.argsort(-counts, kind="stable")] = np.arange(len(counts))
+    return rank[inverse]
+
+
+class FaceClusters:
+    def __init__(self, paths, owners, labels, centroids, sizes, threshold=0.5, store_state=(0, 0)):
+        self.paths = list(paths)        # image paths
+        self.owners = owners            # face row -> index in paths
+        self.labels = labels            # face row -> identity (0 = largest)
+        self.centroids = centroids      # identity -> mean embedding
+        self.sizes = sizes              # identity -> number of faces
+        self.threshold = threshold
+        self.store_state = tuple(store_state)   # EmbeddingStore.state() the faces were read at
+
+    @classmethod
+    def build(cls, paths, owners, matrix, threshold=0.5, k=20, nprobe=8, store_state=(0, 0)):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        index = IVFIndex.build(matrix) if len(matrix) >= ANN_MIN_FACES else None
+        src, dst = knn_graph(matrix, k=k, threshold=threshold, index=index, nprobe=nprobe)
+        labels = _relabel_by_size(chinese_whispers(len(matrix), src, dst))
+        sizes = np.bincount(labels)
+        centroids = np.zeros((len(sizes), matrix.shape[1]), dtype=np.float32)
+        np.add.at(centroids, labels, matrix)
+        centroids /= sizes[:, None]
+        return cls(paths, np.asarray(owners), labels, centroids, sizes, threshold, store_state)
+
+    def member_images(self, identity):
+        """Indices in `paths` of the images showing `identity`, in path order."""
+        return np.unique(self.owners[self.labels == identity])
+
+    def members(self, identity):
+        """Image paths showing `identity`, in path order."""
+        return [self.paths[i] for i in self.member_images(identity)]
+
+    def identities(self, min_faces=2):
+        """Identity ids with at least `min_faces` faces, largest first."""
+        return [int(i) for i in np.flatnonzero(self.sizes >= min_faces)]
+
+    def lookup(self, encoding, tolerance=0.5):
+        """Identity whose centroid is closest to `encoding`, or None if farther than tolerance."""
+        if len(self.centroids) == 0:
+            return None
+        d = face_distances(self.centroids, encoding)[:, 0]
+        best = int(d.argmin())
+        return best if d[best] <= tolerance else None
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.savez(f, paths=np.array(self.paths), owners=self.owners, labels=self.labels,
+                     centroids=self.centroids, sizes=self.sizes, threshold=self.threshold,
+                     store_state=np.array(self.store_state))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["paths"].tolist(), data["owners"], data["labels"], data["centroids"],
+                       data["sizes"], float(data["threshold"]), data["store_state"].tolist())
+
+
+def load_clusters(path, store, threshold=None):
+    """
+    The clusters saved at `path` if `store` has not changed since they were built
+    (and they used `threshold`, when given), otherwise None.
+    """
+    try:
+        clusters = FaceClusters.load(path)
+    except (OSError, KeyError, ValueError):
+        return None
+    if clusters.store_state != tuple(store.state()):
+        return None
+    if threshold is not None and clusters.threshold != threshold:
+        return None
+    return clusters
+
+
+def cluster_folder(folder, threshold=0.5, k=20):
+    """Cluster every face cached in the embedding index of `folder` and save the result (reused while current)."""
+    path = index_path_for(folder, CLUSTERS_FILENAME)
+    with EmbeddingStore(index_path_for(folder)) as store:
+        clusters = load_clusters(path, store, threshold)
+        if clusters is None:
+            paths, owners, matrix = store.load_all()
+            clusters = FaceClusters.build(paths, owners, matrix, threshold=threshold, k=k, store_state=store.state())
+            clusters.save(path)
+    return clusters
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cluster the cached face embeddings of a folder into identities.")
+    parser.add_argument("folder")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--k", type=int, default=20)
+    args = parser.parse_args()
+    clusters = cluster_folder(args.folder, args.threshold, args.k)
+    ids = clusters.identities()
+    print(f"{len(clusters.labels)} faces -> {len(ids)} identities with 2+ faces")
+    for identity in ids[:20]:
+        print(f"Person {identity + 1}: {clusters.sizes[identity]} faces in {len(clusters.members(identity))} images")
@@ -9,107 +9,257 @@ Dependencies:
 Notes:
 - On Linux you may need `espeak` or other TTS backend installed for pyttsx3.
 - Press 'q' to quit the program.
+- Counts are spoken by a background announcer thread (announcer.py), so the video
+  loop never waits for speech; set BLOCKING_TTS = True to compare dropped frames
+  with the old blocking behaviour (both are printed on exit).
+- Faces are detected every DETECT_EVERY frames and tracked in between (tracker.py);
+  the spoken count is the number of tracked faces, and the overlay also shows how
+  many distinct faces have been seen.
+- A motion gate (motion_gate.py) skips detection, and tracking, while the scene is
+  static; skipped frames and the detector CPU time saved are printed on exit.
+- With ADAPTIVE, the detection resolution and Haar scaleFactor are picked by a
+  feedback controller (adaptive.py) to hold TARGET_DETECT_FPS; the tracker and the
+  display keep using the DETECT_SCALE frame. The settings are shown on the video.
+- The captured frame and its resized copies are reused from frame to frame
+  (cap.read into the previous frame, frame_buffers.py), so the loop does not
+  allocate new images at steady state.
+- Each stage (capture, resize, gate, the detector and its detect_resize, track, draw,
+  announce, show and the TTS thread's speak) is timed. --metrics N prints p50/p95/p99 per stage every
+  N seconds, --metrics-port serves them as Prometheus text and --profile dumps a
+  cProfile of the run (metrics.py). The stage table is printed on exit.
+- --headless runs without a window, drawing or speech: the loop goes as fast as
+  capture and detection allow and publishes counts as events (--events stdout,
+  tcp:PORT or http:PORT, see count_events.py); --save-frames DIR writes one
+  annotated frame per --save-every seconds. --source picks a file or stream.
 """
 
+import sys
 import time
+import argparse
+from contextlib import redirect_stdout
 import cv2
-import pyttsx3
 
-def speak_text(engine, text):
-    """Speak text using pyttsx3 in a non-blocking way (uses runAndWait)."""
-    engine.say(text)
-    engine.runAndWait()
+from adaptive import AdaptiveResolution
+from announcer import Announcer
+from boxes import scale_boxes
+from count_events import add_headless_arguments, events_from_args, open_source, sampler_from_args
+from detectors import make_detector
+from frame_buffers import FrameBuffers
+from frame_pipeline import FrameDrops, StageStats
+from metrics import add_metrics_arguments, profiled, start_metrics
+from tracker import MultiTracker, available_backend
+from motion_gate import MotionGate
 
-def main():
-    # Initialize TTS engine
-    engine = pyttsx3.init()
+# Run the Haar detector on every Nth frame; trackers move the boxes in between
+DETECT_EVERY = 5
+# "kcf", "mosse", "csrt" (need opencv-contrib-python) or "iou"; falls back to "iou"
+TRACKER_BACKEND = "kcf"
+# Frames are shrunk by this factor before detection (1.0 = full resolution, like face_detection.py)
+DETECT_SCALE = 0.6
+# Face detector backend from detectors.py: "haar" or "yunet" (OpenCV DNN, needs the model file)
+FACE_BACKEND = "haar"
+# Adapt detection resolution / scaleFactor to hold TARGET_DETECT_FPS detections per second
+ADAPTIVE = True
+TARGET_DETECT_FPS = 15
+# Speak inside the video loop like the original script (for before/after frame-drop comparisons)
+BLOCKING_TTS = False
+
+class FaceDetector:
+    """Face detector on a `scale`d copy of the frame (Haar cascade included with opencv by default)."""
+
+    def __init__(self, scale=DETECT_SCALE, backend=FACE_BACKEND, controller=None, stats=None):
+        self.scale = scale
+        self.backend = make_detector(backend, warmup=backend != "haar")
+        self.controller = controller
+        self.stats = stats or StageStats()
+        self.buffers = FrameBuffers()
+
+    def detect(self, small):
+        """Faces in `small` (BGR), in its own pixels."""
+        with self.stats.timer(self.backend.name):
+            return self.backend.detect(small).faces
+
+    def __call__(self, frame):
+        """Faces in a full BGR frame, detected at `scale` (or the controller's width) and returned in frame pixels."""
+        t0 = time.perf_counter()
+        scale = self.scale
+        if self.controller is not None:
+            settings = self.controller.settings
+            self.backend.configure(settings)
+            scale = min(1.0, settings.width / frame.shape[1])
+        # its own stage: the main loop's DETECT_SCALE resize is timed as "resize"
+        with self.stats.timer("detect_resize"):
+            small = frame if scale == 1.0 else self.buffers.scale("small", frame, scale)
+        faces = self.detect(small)
+        faces = scale_boxes(faces, frame.shape[1] / small.shape[1], frame.shape[0] / small.shape[0])
+        if self.controller is not None:
+            self.controller.record(time.perf_counter() - t0)
+        return faces
+
+def configure_voice(engine):
     # Optional: tweak voice rate/volume
     rate = engine.getProperty('rate')
     engine.setProperty('rate', max(120, rate - 20))  # a bit slower
     volume = engine.getProperty('volume')
     engine.setProperty('volume', volume)  # 0.0 to 1.0
 
-    # Initialize face detector (Haar cascade included with opencv)
-    cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-    face_cascade = cv2.CascadeClassifier(cascade_path)
-    if face_cascade.empty():
-        raise RuntimeError("Failed to load Haar cascade. Check OpenCV installation.")
+def draw_faces(frame, small, ids, boxes, seen, controller=None):
+    # Draw rectangles around faces (scale coordinates back to full frame)
+    scale_x = frame.shape[1] / small.shape[1]
+    scale_y = frame.shape[0] / small.shape[0]
+    frame_boxes = scale_boxes(boxes, scale_x, scale_y)
+    for face_id, (x1, y1, w, h) in zip(ids.tolist(), frame_boxes.tolist()):
+        x2, y2 = x1 + w, y1 + h
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.putText(frame, f"#{face_id}", (x1, y1 - 6), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.5, (0, 255, 0), 1, cv2.LINE_AA)
 
-    # Open default webcam
-    cap = cv2.VideoCapture(0)
+    # Overlay the count on the video
+    label = f"Faces: {len(ids)}  (seen: {seen})"
+    cv2.putText(frame, label, (10, 30), cv2.FONT_HERSHEY_SIMPLEX,
+                1.0, (0, 255, 255), 2, cv2.LINE_AA)
+    if controller is not None:
+        cv2.putText(frame, controller.format(), (10, 55), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.5, (255, 255, 255), 1, cv2.LINE_AA)
+
+def main(args):
+    # Per-stage timings for --metrics and the exit summary
+    stats = StageStats(window=500)
+    reporter = start_metrics(args, stats, prefix="face_counter")
+
+    # Initialize TTS (the engine lives on the announcer thread); headless publishes events instead
+    announcer = None if args.headless else Announcer(configure=configure_voice, blocking=BLOCKING_TTS, stats=stats)
+    events = events_from_args(args, "face_counter")
+    sampler = sampler_from_args(args, "faces")
+
+    # Initialize face detector
+    controller = AdaptiveResolution(TARGET_DETECT_FPS) if ADAPTIVE else None
+    detector = FaceDetector(controller=controller, stats=stats)
+
+    # Open the webcam (or --source)
+    cap = open_source(args.source)
     if not cap.isOpened():
-        print("Error: Could not open webcam.")
+        print(f"Error: Could not open video source {args.source}.")
         return
 
+    drops = FrameDrops(1.0 / (cap.get(cv2.CAP_PROP_FPS) or 30))
+    tracker = MultiTracker(backend=available_backend(TRACKER_BACKEND))
+    gate = MotionGate()
+    buffers = FrameBuffers()
+    frame = None
+    frame_index = 0
+    static = False
+
     prev_count = -1
     last_spoken_time = 0.0
     # Minimum seconds between speaking events to avoid rapid repetition
     MIN_SPEAK_GAP = 0.8
 
-    print("Starting webcam. Press 'q' to quit.")
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            print("Failed reading frame from webcam — exiting.")
-            break
-
-        # Optional: resize to speed up detection (adjust as needed)
-        small = cv2.resize(frame, (0, 0), fx=0.6, fy=0.6)
-        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
-
-        # Detect faces. tweak scaleFactor and minNeighbors for your environment
-        faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
-
-        # Draw rectangles around faces (scale coordinates back to full frame)
-        scale_x = frame.shape[1] / small.shape[1]
-        scale_y = frame.shape[0] / small.shape[0]
-        for (x, y, w, h) in faces:
-            x1 = int(x * scale_x)
-            y1 = int(y * scale_y)
-            x2 = int((x + w) * scale_x)
-            y2 = int((y + h) * scale_y)
-            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-
-        count = len(faces)
-
-        # If the count changed, speak it (with a small debounce)
-        now = time.time()
-        if count != prev_count and (now - last_spoken_time) >= MIN_SPEAK_GAP:
-            # Human-friendly phrasing
-            if count == 0:
-                phrase = "No people in the room."
-            elif count == 1:
-                phrase = "One person."
-            else:
-                phrase = f"{count} people."
-            # Speak (blocking until finished). If you prefer non-blocking,
-            # run speak_text in a separate thread.
-            try:
-                speak_text(engine, phrase)
-                last_spoken_time = now
-            except Exception as e:
-                print("TTS error:", e)
+    print("Starting headless counter. Press Ctrl+C to stop." if args.headless else f"Reading {args.source}. Press 'q' to quit.")
+    try:
+        while True:
+            # decodes into the previous frame's array when the size is unchanged
+            with stats.timer("capture"):
+                ret, frame = cap.read(frame)
+            if not ret:
+                print("Failed reading frame from video source — exiting.")
+                break
 
-            prev_count = count
+            # Optional: resize to speed up detection (adjust as needed)
+            with stats.timer("resize"):
+                small = buffers.scale("small", frame, DETECT_SCALE)
 
-        # Overlay the count on the video
-        label = f"Faces: {count}"
-        cv2.putText(frame, label, (10, 30), cv2.FONT_HERSHEY_SIMPLEX,
-                    1.0, (0, 255, 255), 2, cv2.LINE_AA)
+            if frame_index % DETECT_EVERY == 0:
+                # Nothing moved since the background model settled: keep the current faces
+                with stats.timer("gate"):
+                    static = not gate(small)
+                if not static:
+                    t0 = time.perf_counter()
+                    # Detect faces
+                    if controller is not None:
+                        # at the controller's resolution, mapped into `small` for the tracker
+                        faces = scale_boxes(detector(frame), small.shape[1] / frame.shape[1], small.shape[0] / frame.shape[0])
+                    else:
+                        faces = detector.detect(small)
+                    elapsed = time.perf_counter() - t0
+                    stats.record("detect", elapsed)
+                    gate.record_detection(elapsed)
+                    with stats.timer("track"):
+                        tracker.update(small, faces)
+            elif not static:
+                with stats.timer("track"):
+                    tracker.predict(small)
+            frame_index += 1
+            count = len(tracker.ids)
 
-        cv2.imshow('Face Counter', frame)
+            # Headless: only draw the frames that are sampled to disk
+            save = sampler is not None and sampler.due()
+            if save or not args.headless:
+                with stats.timer("draw"):
+                    draw_faces(frame, small, tracker.ids, tracker.boxes, tracker.unique_count, controller)
+            if save:
+                with stats.timer("save"):
+                    sampler.save(frame)
 
-        # Quit on 'q' key
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+            if events is not None:
+                with stats.timer("publish"):
+                    events.publish(count, tracker.unique_count, frame_index)
 
-    cap.release()
-    cv2.destroyAllWindows()
-    # Clean up TTS engine
-    try:
-        engine.stop()
-    except Exception:
+            # If the count changed, speak it (with a small debounce)
+            now = time.time()
+            if announcer is not None and count != prev_count and (now - last_spoken_time) >= MIN_SPEAK_GAP:
+                # Human-friendly phrasing
+                if count == 0:
+                    phrase = "No people in the room."
+                elif count == 1:
+                    phrase = "One person."
+                else:
+                    phrase = f"{count} people."
+                # Queued for the announcer thread; replaces any phrase not yet spoken
+                with stats.timer("announce"):
+                    announcer.say(phrase)
+                last_spoken_time = now
+                prev_count = count
+
+            if args.headless:
+                continue
+            with stats.timer("show"):
+                cv2.imshow('Face Counter', frame)
+                key = cv2.waitKey(1) & 0xFF
+            drops.tick()
+
+            # Quit on 'q' key
+            if key == ord('q'):
+                break
+    except KeyboardInterrupt:
         pass
 
+    if reporter is not None:
+        reporter.stop()
+    print("Stage latency (ms):")
+    print(stats.report())
+    print(gate.report())
+    if controller is not None:
+        print("Adaptive resolution:", controller.format(), f"({controller.changes} changes)")
+    if events is not None:
+        print(events.report())
+        events.close()
+    if sampler is not None:
+        print(f"saved {sampler.saved} frames to {sampler.directory}")
+    cap.release()
+    if not args.headless:
+        print(drops.report())
+        cv2.destroyAllWindows()
+    if announcer is not None:
+        print(announcer.report())
+        # Clean up TTS engine
+        announcer.stop()
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Count faces from the webcam and speak the count.")
+    add_metrics_arguments(parser)
+    add_headless_arguments(parser)
+    args = parser.parse_args()
+    # headless: stdout carries only the JSONL events, log lines go to stderr
+    with redirect_stdout(sys.stderr if args.headless else sys.stdout), profiled(args.profile):
+        main(args)
@@ -1,39 +1,81 @@
+import argparse
+
 import cv2
 
-# Load the pre-trained face detection model (Haar Cascade)
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+from adaptive import AdaptiveResolution
+from face_counter import FaceDetector
+from frame_pipeline import StageStats
+from metrics import add_metrics_arguments, profiled, start_metrics
+from tracker import MultiTracker, available_backend
+
+# Face detector from detectors.py: "haar" (Haar cascade) or "yunet" (OpenCV DNN, needs the model file)
+BACKEND = "haar"
+# Detection resolution and scaleFactor adapt to hold this many detections per second
+TARGET_DETECT_FPS = 15
+
+# Run the detector on every Nth frame and track the faces in between
+DETECT_EVERY = 5
+tracker = MultiTracker(backend=available_backend("kcf"))
+frame_index = 0
+
+# --metrics N / --metrics-port PORT report per-stage p50/p95/p99 latency, --profile FILE dumps cProfile stats
+parser = argparse.ArgumentParser(description="Detect and track faces from the webcam.")
+add_metrics_arguments(parser)
+args = parser.parse_args()
+stats = StageStats(window=500)
+reporter = start_metrics(args, stats, prefix="face_detection")
+
+# Load the pre-trained face detection model; it detects on a downscaled copy whose
+# width the controller picks, and returns boxes in full-frame pixels
+controller = AdaptiveResolution(TARGET_DETECT_FPS)
+detector = FaceDetector(scale=1.0, backend=BACKEND, controller=controller, stats=stats)
 
 # Initialize webcam (0 for default camera)
 cap = cv2.VideoCapture(0)
+frame = None
 
-while True:
-    # Read frame from webcam
-    ret, frame = cap.read()
-    if not ret:
-        break
+with profiled(args.profile):
+    while True:
+        # Read frame from webcam (into the previous frame's array, no new allocation)
+        with stats.timer("capture"):
+            ret, frame = cap.read(frame)
+        if not ret:
+            break
 
-    # Convert to grayscale (for faster processing)
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if frame_index % DETECT_EVERY == 0:
+            # Detect faces
+            with stats.timer("detect"):
+                faces = detector(frame)
+            with stats.timer("track"):
+                tracker.update(frame, faces)
+        else:
+            # Move the known faces with the trackers instead of detecting again
+            with stats.timer("track"):
+                tracker.predict(frame)
+        frame_index += 1
 
-    # Detect faces
-    faces = face_cascade.detectMultiScale(
-        gray,
-        scaleFactor=1.1,   # Parameter specifying how much the image size is reduced at each image scale.
-        minNeighbors=5,    # Specifies how many neighbors each candidate rectangle should have to retain it.
-        minSize=(30, 30)   # Minimum size of detected face
-    )
+        # Draw rectangles around tracked faces
+        with stats.timer("draw"):
+            for face_id, (x, y, w, h) in zip(tracker.ids.tolist(), tracker.boxes.tolist()):
+                cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+                cv2.putText(frame, f"#{face_id}", (x, y-6), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
 
-    # Draw rectangles around detected faces
-    for (x, y, w, h) in faces:
-        cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+            # Current detection settings and rate
+            cv2.putText(frame, controller.format(), (10, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
 
-    # Display the frame
-    cv2.imshow('Face Detection', frame)
+        # Display the frame
+        with stats.timer("show"):
+            cv2.imshow('Face Detection', frame)
+            key = cv2.waitKey(1) & 0xFF
 
-    # Exit when 'q' key is pressed
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
+        # Exit when 'q' key is pressed
+        if key == ord('q'):
+            break
 
 # Release resources
+if reporter is not None:
+    reporter.stop()
+print("Stage latency (ms):")
+print(stats.report())
 cap.release()
 cv2.destroyAllWindows()
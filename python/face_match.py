@@ -0,0 +1,119 @@
+"""
+face_match.py
+
+Vectorized face matching over a whole embedding matrix.
+
+Requirements:
+  pip install numpy
+
+How it works (summary):
+  - All known embeddings are stacked in an (N, D) matrix (one row per face).
+  - Distances to every reference face are computed as one matrix product,
+    in row chunks so memory stays bounded for millions of faces.
+  - Threshold mode keeps faces with distance <= tolerance, exactly like
+    face_recognition.compare_faces; top-k mode returns the k closest.
+  - With `owners` (row -> image index) results are reduced to one best hit per image.
+  - match_identities() answers several people in one pass: distances are computed
+    once and results are grouped per identity label of the reference faces.
+"""
+
+import numpy as np
+
+CHUNK_ROWS = 65536
+
+
+def face_distances(matrix, refs, metric="euclidean", chunk_rows=CHUNK_ROWS):
+    """Distance of every row of `matrix` (N, D) to every reference (R, D). Returns (N, R)."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    refs = np.atleast_2d(np.asarray(refs, dtype=np.float32))
+    out = np.empty((len(matrix), len(refs)), dtype=np.float32)
+    if len(matrix) == 0 or len(refs) == 0:
+        return out
+
+    if metric == "cosine":
+        refs_n = refs / np.maximum(np.linalg.norm(refs, axis=1, keepdims=True), 1e-12)
+    elif metric == "euclidean":
+        ref_sq = np.einsum("ij,ij->i", refs, refs)
+    else:
+        raise ValueError(f"Unknown metric: {metric}")
+
+    for start in range(0, len(matrix), chunk_rows):
+        block = matrix[start:start + chunk_rows]
+        if metric == "cosine":
+            norms = np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+            d = 1.0 - (block / norms) @ refs_n.T
+        else:
+            # ||a - b||^2 = ||a||^2 + ||b||^2 - 2 a.b
+            d = np.einsum("ij,ij->i", block, block)[:, None] + ref_sq[None, :] - 2.0 * (block @ refs.T)
+            np.sqrt(np.maximum(d, 0.0), out=d)
+        out[start:start + len(block)] = d
+    return out
+
+
+def match(matrix, refs, tolerance=None, top_k=None, owners=None, metric="euclidean"):
+    """
+    Match every row of `matrix` against the reference embeddings `refs`.
+
+    tolerance: keep results with distance <= tolerance (compare_faces semantics).
+    top_k:     keep only the k closest results (can be combined with tolerance).
+    owners:    optional int array mapping each row to an image index; results are
+               then reported per image using its closest face.
+
+    Returns a list of (index, ref_index, distance) sorted by distance, where index is
+    the row index, or the owner index when `owners` is given.
+    """
+    if tolerance is None and top_k is None:
+        raise ValueError("Give a tolerance, a top_k, or both.")
+
+    dist = face_distances(matrix, refs, metric=metric)
+    if dist.size == 0:
+        return []
+    best_ref = dist.argmin(axis=1)
+    return _select(best_ref, dist[np.arange(len(dist)), best_ref], owners, tolerance, top_k)
+
+
+def match_identities(matrix, refs, labels, tolerance=None, top_k=None, owners=None, metric="euclidean"):
+    """
+    Like match(), but reference faces carry identity `labels` (one per row of refs).
+    Returns {label: [(index, ref_index, distance), ...]} with each identity matched
+    independently (an image showing two of the people appears in both lists).
+    """
+    if tolerance is None and top_k is None:
+        raise ValueError("Give a tolerance, a top_k, or both.")
+
+    dist = face_distances(matrix, refs, metric=metric)
+    labels = np.asarray(labels)
+    grouped = {}
+    for label in dict.fromkeys(labels.tolist()):
+        cols = np.flatnonzero(labels == label)
+        if dist.size == 0:
+            grouped[label] = []
+            continue
+        sub = dist[:, cols]
+        local = sub.argmin(axis=1)
+        grouped[label] = _select(cols[local], sub[np.arange(len(sub)), local], owners, tolerance, top_k)
+    return grouped
+
+
+def _select(best_ref, best, owners, tolerance, top_k):
+    index = np.arange(len(best))
+
+    if owners is not None:
+        owners = np.asarray(owners)
+        # sort by (owner, distance) and keep the first row of each owner
+        order = np.lexsort((best, owners))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = owners[order[1:]] != owners[order[:-1]]
+        keep = order[first]
+        index, best_ref, best = owners[keep], best_ref[keep], best[keep]
+
+    if tolerance is not None:
+        ok = best <= tolerance
+        index, best_ref, best = index[ok], best_ref[ok], best[ok]
+
+    if top_k is not None and top_k < len(best):
+        part = np.argpartition(best, top_k)[:top_k]
+        index, best_ref, best = index[part], best_ref[part], best[part]
+
+    order = np.argsort(best, kind="stable")
+    return [(int(index[i]), int(best_ref[i]), float(best[i])) for i in order]
@@ -1,6 +1,9 @@
 import sys
 import os
 import shutil
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, wait
 from pathlib import Path
 from io import BytesIO
 
@@ -10,24 +13,73 @@ from PyQt5.QtWidgets import (
     QProgressBar, QSpinBox, QMessageBox
 )
 from PyQt5.QtGui import QPixmap, QImage, QIcon
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
+from PyQt5.QtCore import Qt, QSize, QThread, pyqtSignal
 
-from PIL import Image, ImageQt
+from PIL import ImageQt
 import numpy as np
 import face_recognition
 
+from embedding_store import EmbeddingStore, cached_lookup, index_path_for
+from face_ann import ANN_FILENAME, ANN_MIN_FACES, load_or_update
+from face_cluster import CLUSTERS_FILENAME, FaceClusters, load_clusters
+from face_encoder import decode_image, encode_decoded, encode_image
+from face_match import face_distances, match_identities
+from folder_walker import iter_images, prefetch
+from thumb_cache import ThumbnailCache
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def load_identities(reference):
+    """
+    Normalize a reference to {identity: [image paths]}.
+    Accepts a single image, a list of images (one identity per file, named by its stem),
+    a dict, or a folder: top-level images are identities named by file stem and each
+    subfolder is one identity holding several photos of the same person.
+    """
+    if isinstance(reference, dict):
+        return {name: [Path(p) for p in paths] for name, paths in reference.items()}
+    if isinstance(reference, (list, tuple)):
+        return {Path(p).stem: [Path(p)] for p in reference}
+
+    reference = Path(reference)
+    if not reference.is_dir():
+        return {reference.stem: [reference]}
+    identities = {}
+    for entry in sorted(reference.iterdir()):
+        if entry.name.startswith("."):
+            continue
+        if entry.is_dir():
+            photos = [Path(p) for p in iter_images(entry, exts=IMAGE_EXTS)]
+            if photos:
+                identities[entry.name] = photos
+        elif entry.suffix.lower() in IMAGE_EXTS:
+            identities[entry.stem] = [entry]
+    return identities
+
+
 # ---------- Worker thread that does scanning and matching ----------
 class MatcherThread(QThread):
-    progress = pyqtSignal(int)                 # percent
-    status = pyqtSignal(str)                   # text status
-    matched = pyqtSignal(str, QPixmap)         # image path + pixmap
-    finished_signal = pyqtSignal(list)         # list of matched paths
-
-    def __init__(self, folder, reference_path, tolerance=0.45):
+    progress = pyqtSignal(int)                      # images scanned so far
+    status = pyqtSignal(str)                        # text status
+    matched = pyqtSignal(str, QPixmap, float, str)  # image path + pixmap + face distance + identity
+    finished_signal = pyqtSignal(list)              # list of matched paths
+    grouped_signal = pyqtSignal(dict)               # identity -> [(path, distance), ...]
+
+    def __init__(self, folder, reference, tolerance=0.45, use_index=True, top_k=None, workers=1,
+                 ann_nprobe=0, detect_max_side=None, thumbs=None, io_threads=4, recursive=True):
         super().__init__()
         self.folder = Path(folder)
-        self.reference_path = Path(reference_path)
+        self.identities = load_identities(reference)   # several people are matched in one pass
         self.tolerance = tolerance
+        self.top_k = top_k              # if set, return the k closest images instead of using tolerance
+        self.use_index = use_index      # reuse embeddings cached from earlier scans
+        self.workers = max(1, workers)  # > 1 encodes images in a process pool
+        self.ann_nprobe = ann_nprobe    # > 0 searches only that many IVF cells (faster, approximate)
+        self.detect_max_side = detect_max_side  # detect faces on a copy this small, encode at full size
+        self.thumbs = thumbs or ThumbnailCache()
+        self.io_threads = io_threads    # background threads decoding the next images
+        self.recursive = recursive      # also scan subfolders
         self._is_running = True
 
     def stop(self):
@@ -35,67 +87,309 @@ class MatcherThread(QThread):
 
     def run(self):
         matched = []
+        matched_set = set()
         try:
-            self.status.emit(f"Loading reference image...")
-            ref_image = face_recognition.load_image_file(str(self.reference_path))
-            ref_encs = face_recognition.face_encodings(ref_image)
+            self.status.emit(f"Loading {len(self.identities)} reference identities...")
+            ref_encs, ref_labels = self._load_references()
             if not ref_encs:
-                self.status.emit("No face found in reference image.")
+                self.status.emit("No face found in the reference images.")
                 self.finished_signal.emit([])
                 return
-            ref_enc = ref_encs[0]
+            ref_encs = np.asarray(ref_encs, dtype=np.float32)
         except Exception as e:
             self.status.emit(f"Failed to load reference: {e}")
             self.finished_signal.emit([])
             return
 
-        images = [p for p in self.folder.iterdir() if p.suffix.lower() in ('.jpg', '.jpeg', '.png', '.bmp')]
-        total = max(1, len(images))
-        self.status.emit(f"Scanning {total} images...")
-
-        for idx, img_path in enumerate(images, start=1):
-            if not self._is_running:
-                self.status.emit("Cancelled.")
-                break
+        store = self._open_store()
+        # approximate search reads its candidates back from the store, so the scan keeps no embeddings
+        use_ann = bool(self.ann_nprobe) and store is not None
+        face_paths, chunks, seen, n_faces = self._index_folder(store, keep_embeddings=not use_ann)
+
+        cancelled = not self._is_running
+        if cancelled:
+            self.status.emit("Cancelled.")
+        elif store is not None:
+            store.prune(seen)
+
+        # Phase 2: a single vectorized match of all identities over all faces found so far
+        grouped = {name: [] for name in self.identities}
+        # after "Index Everyone", a tolerance match is a lookup in the saved clusters
+        clusters = None
+        if n_faces and store is not None and not cancelled and not self.top_k:
+            clusters = load_clusters(index_path_for(self.folder, CLUSTERS_FILENAME), store)
+        if clusters is not None:
+            face_paths = clusters.paths
+            results = self._cluster_matches(clusters, ref_encs, ref_labels)
+            self.status.emit(f"Looked up {len(results)} identities in {len(clusters.sizes)} clustered identities.")
+        elif n_faces:
+            if use_ann:
+                face_paths, owners, matrix = self._ann_candidates(store, ref_encs, n_faces, seen, cancelled)
+            else:
+                matrix = np.vstack(chunks)
+                owners = np.repeat(np.arange(len(chunks)), [len(c) for c in chunks])
+            if self.top_k:
+                results = match_identities(matrix, ref_encs, ref_labels, top_k=self.top_k, owners=owners)
+            else:
+                results = match_identities(matrix, ref_encs, ref_labels, tolerance=self.tolerance, owners=owners)
+            self.status.emit(f"Matched {len(matrix)} faces against {len(results)} identities.")
+        else:
+            results = {}
 
-            try:
-                # load and get encodings
-                unknown_img = face_recognition.load_image_file(str(img_path))
-                encs = face_recognition.face_encodings(unknown_img)
-
-                found = False
-                if encs:
-                    matches = face_recognition.compare_faces(encs, ref_enc, tolerance=self.tolerance)
-                    if any(matches):
-                        found = True
-
-                # emit if matched
-                if found:
-                    matched.append(str(img_path))
-                    pix = self._make_pixmap(str(img_path), max_size=200)
-                    self.matched.emit(str(img_path), pix)
-
-                percent = int((idx / total) * 100)
-                self.progress.emit(percent)
-                self.status.emit(f"Scanned {idx}/{total}: {img_path.name} {'(MATCH)' if found else ''}")
+        for identity, hits in results.items():
+            for image_idx, _, distance in hits:
+                path = face_paths[image_idx]
+                grouped[identity].append((path, distance))
+                if path not in matched_set:
+                    matched_set.add(path)
+                    matched.append(path)
+                pix = self._make_pixmap(path, max_size=200)
+                self.matched.emit(path, pix, distance, identity)
 
-            except Exception as e:
-                # continue on error but report
-                self.status.emit(f"Error scanning {img_path.name}: {e}")
+        if store is not None:
+            store.close()
 
         self.status.emit("Finished scanning.")
+        self.grouped_signal.emit(grouped)
         self.finished_signal.emit(matched)
 
-    def _make_pixmap(self, path, max_size=200):
+    def _open_store(self):
+        if not self.use_index:
+            return None
+        try:
+            return EmbeddingStore(index_path_for(self.folder))
+        except Exception as e:
+            self.status.emit(f"Embedding index unavailable, scanning without it: {e}")
+            return None
+
+    def _index_folder(self, store, keep_embeddings=True):
+        """
+        Phase 1: collect the embeddings of every image (cached or freshly encoded).
+        Returns (images with faces, their (k, 128) embedding arrays, every image visited,
+        number of faces); the arrays are only kept with keep_embeddings.
+        """
+        # streamed lazily, so scanning starts before the whole tree has been listed
+        images = iter_images(self.folder, exts=IMAGE_EXTS, recursive=self.recursive)
+        face_paths = []     # images that contain at least one face
+        chunks = []         # (k, 128) embedding arrays, one per entry in face_paths
+        seen = []           # every image visited, to prune deleted files from the index
+        n_faces = 0
+        self.status.emit(f"Scanning with {self.workers} worker(s)...")
+        for idx, (img_path, encs) in enumerate(self._iter_encodings(store, images), start=1):
+            seen.append(img_path)
+            self.progress.emit(idx)
+            if isinstance(encs, Exception):
+                # continue on error but report
+                self.status.emit(f"Error scanning {os.path.basename(img_path)}: {encs}")
+                continue
+
+            if len(encs):
+                n_faces += len(encs)
+                face_paths.append(img_path)
+                if keep_embeddings:
+                    chunks.append(np.asarray(encs, dtype=np.float32))
+
+            self.status.emit(f"Indexed {idx}: {os.path.basename(img_path)}")
+        return face_paths, chunks, seen, n_faces
+
+    def _cluster_matches(self, clusters, ref_encs, ref_labels):
+        """
+        match_identities()-style results from saved clusters: every image of the cluster
+        each reference falls in, at the reference's distance to that cluster's centroid.
+        """
+        results = {}
+        for ref_idx, (enc, label) in enumerate(zip(ref_encs, ref_labels)):
+            hits = results.setdefault(label, [])
+            identity = clusters.lookup(enc, tolerance=self.tolerance)
+            if identity is None:
+                continue
+            distance = float(face_distances(clusters.centroids[[identity]], enc)[0, 0])
+            known = {image_idx for image_idx, _, _ in hits}
+            hits.extend((int(i), ref_idx, distance) for i in clusters.member_images(identity) if i not in known)
+        return results
+
+    def _ann_candidates(self, store, ref_encs, n_faces, seen, cancelled):
+        """
+        (image paths, owners, matrix) of the stored faces worth ranking: those in the IVF
+        cells closest to the references, or every stored face below ANN_MIN_FACES.
+        """
+        if n_faces >= ANN_MIN_FACES:
+            # approximate search: only rank faces in the cells closest to the references
+            self.status.emit(f"Updating approximate index for {n_faces} faces...")
+            index = load_or_update(index_path_for(self.folder, ANN_FILENAME), store)
+            paths, owners, matrix = store.load_images(index.probe(ref_encs, self.ann_nprobe))
+        else:
+            paths, owners, matrix = store.load_all()
+        if cancelled:
+            # not pruned: the store may still list images this scan did not reach
+            visited = set(seen)
+            rows = np.flatnonzero([paths[i] in visited for i in owners])
+            owners, matrix = owners[rows], matrix[rows]
+        return paths, owners, matrix
+
+    def _load_references(self):
+        """Encode the first face of every reference photo. Returns (encodings, identity labels)."""
+        encs, labels = [], []
+        for identity, paths in self.identities.items():
+            for path in paths:
+                faces = face_recognition.face_encodings(face_recognition.load_image_file(str(path)))
+                if faces:
+                    encs.append(faces[0])
+                    labels.append(identity)
+                else:
+                    self.status.emit(f"No face found in reference {path.name}, skipping it.")
+        return encs, labels
+
+    def _iter_encodings(self, store, images):
+        """
+        Yield (img_path, encodings or exception) in folder order.
+        With workers > 1 uncached images are encoded in a process pool while
+        cached ones are read from the store; stops early once stop() is called.
+        """
+        if self.workers == 1:
+            # cache lookups happen here; decoding of the next images runs on I/O threads
+            lookups = (cached_lookup(store, p) for p in images)
+            # decoded images in flight are bounded to io_threads + 1; with detect_max_side they
+            # are only the small detection copies (face_encoder.decode_image)
+            for (img_path, key, encs), decoded in prefetch(lookups, self._decode, workers=self.io_threads):
+                if not self._is_running:
+                    return
+                if encs is None:
+                    try:
+                        if isinstance(decoded, Exception):
+                            raise decoded
+                        encs = encode_decoded(decoded)
+                        if store is not None:
+                            store.put(img_path, key[0], key[1], encs)
+                    except Exception as e:
+                        encs = e
+                yield img_path, encs
+            return
+
+        # spawn: forking a process that runs Qt threads is not safe
+        pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        pending = deque()
+        todo = iter(images)
         try:
-            im = Image.open(path)
-            im.thumbnail((max_size, max_size), Image.LANCZOS)
-            qim = ImageQt.ImageQt(im.convert("RGBA"))
-            pix = QPixmap.fromImage(qim)
-            return pix
-        except Exception:
-            # fallback: empty pixmap
-            return QPixmap(max_size, max_size)
+            while self._is_running:
+                # keep a few jobs per worker queued so no core idles
+                while len(pending) < self.workers * 4:
+                    img_path = next(todo, None)
+                    if img_path is None:
+                        break
+                    pending.append(self._submit(pool, store, img_path))
+                if not pending:
+                    return
+
+                img_path, key, job = pending.popleft()
+                if isinstance(job, Future):
+                    while not job.done():
+                        if not self._is_running:
+                            return
+                        wait([job], timeout=0.1)
+                    try:
+                        encs = job.result()
+                        if store is not None:
+                            store.put(img_path, key[0], key[1], encs)
+                    except Exception as e:
+                        encs = e
+                else:
+                    encs = job
+                yield img_path, encs
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _decode(self, lookup):
+        img_path, _, encs = lookup
+        if encs is not None:
+            return None     # cached or failed: nothing to decode
+        return decode_image(img_path, self.detect_max_side)
+
+    def _submit(self, pool, store, img_path):
+        """Like cached_lookup(), but uncached images are sent to the process pool as a Future."""
+        img_path, key, encs = cached_lookup(store, img_path)
+        if encs is None:
+            encs = pool.submit(encode_image, img_path, self.detect_max_side)
+        return img_path, key, encs
+
+    def _make_pixmap(self, path, max_size=200):
+        return make_pixmap(self.thumbs, path, max_size)
+
+
+# ---------- Worker thread that clusters every face into identities ----------
+class ClusterThread(MatcherThread):
+    identity_found = pyqtSignal(int, str, QPixmap, int)  # identity id + name + pixmap + number of images
+    clusters_ready = pyqtSignal(object)                   # FaceClusters
+
+    def __init__(self, folder, reference=None, threshold=0.5, max_shown=200, **kwargs):
+        kwargs["use_index"] = True      # clustering reads every face back from the index
+        super().__init__(folder, reference or {}, **kwargs)
+        self.threshold = threshold
+        self.max_shown = max_shown
+
+    def run(self):
+        store = self._open_store()
+        if store is None:
+            self.finished_signal.emit([])
+            return
+        _, _, seen, _ = self._index_folder(store, keep_embeddings=False)
+        if not self._is_running:
+            store.close()
+            self.status.emit("Cancelled.")
+            self.finished_signal.emit([])
+            return
+
+        store.prune(seen)
+        path = index_path_for(self.folder, CLUSTERS_FILENAME)
+        clusters = load_clusters(path, store, self.threshold)
+        if clusters is not None:
+            self.status.emit(f"No changes since the last run: loaded {len(clusters.labels)} clustered faces.")
+        else:
+            paths, owners, matrix = store.load_all()
+            if len(matrix):
+                self.status.emit(f"Clustering {len(matrix)} faces...")
+                clusters = FaceClusters.build(paths, owners, matrix, threshold=self.threshold,
+                                              store_state=store.state())
+                try:
+                    clusters.save(path)
+                except OSError as e:
+                    self.status.emit(f"Could not save clusters: {e}")
+        store.close()
+        if clusters is None:
+            self.status.emit("No faces found.")
+            self.finished_signal.emit([])
+            return
+
+        # reference people are now a lookup in the clustering, not a scan
+        names = {}
+        if self.identities:
+            ref_encs, ref_labels = self._load_references()
+            for enc, name in zip(ref_encs, ref_labels):
+                identity = clusters.lookup(enc, tolerance=self.tolerance)
+                if identity is not None:
+                    names.setdefault(identity, name)
+
+        identities = clusters.identities()
+        shown = sorted(names) + [i for i in identities if i not in names]
+        for identity in shown[:self.max_shown]:
+            members = clusters.members(identity)
+            name = names.get(identity, f"Person {identity + 1}")
+            self.identity_found.emit(identity, name, self._make_pixmap(members[0], max_size=96), len(members))
+
+        self.status.emit(f"Clustered {len(clusters.labels)} faces into {len(identities)} identities.")
+        self.clusters_ready.emit(clusters)
+        self.finished_signal.emit([])
+
+
+def make_pixmap(thumbs, path, max_size=200):
+    try:
+        im = thumbs.get(path, (max_size, max_size))
+        qim = ImageQt.ImageQt(im.convert("RGBA"))
+        pix = QPixmap.fromImage(qim)
+        return pix
+    except Exception:
+        # fallback: empty pixmap
+        return QPixmap(max_size, max_size)
 
 
 # ---------- Main Window ----------
@@ -108,6 +402,8 @@ class FaceMatcherApp(QWidget):
         self.reference = None
         self.matcher_thread = None
         self.matched_paths = []
+        self.thumbs = ThumbnailCache()
+        self.clusters = None
 
         self._build_ui()
 
@@ -116,9 +412,12 @@ class FaceMatcherApp(QWidget):
         self.select_folder_btn = QPushButton("Select Folder to Scan")
         self.select_folder_btn.clicked.connect(self.select_folder)
 
-        self.select_ref_btn = QPushButton("Select Reference Image")
+        self.select_ref_btn = QPushButton("Select Reference Images")
         self.select_ref_btn.clicked.connect(self.select_reference)
 
+        self.select_ref_folder_btn = QPushButton("Select Reference Folder")
+        self.select_ref_folder_btn.clicked.connect(self.select_reference_folder)
+
         self.start_btn = QPushButton("Start Scan")
         self.start_btn.clicked.connect(self.start_scan)
         self.start_btn.setEnabled(False)
@@ -127,6 +426,11 @@ class FaceMatcherApp(QWidget):
         self.cancel_btn.clicked.connect(self.cancel_scan)
         self.cancel_btn.setEnabled(False)
 
+        self.cluster_btn = QPushButton("Index Everyone")
+        self.cluster_btn.setToolTip("Cluster every face in the folder into identities")
+        self.cluster_btn.clicked.connect(self.start_clustering)
+        self.cluster_btn.setEnabled(False)
+
         self.copy_btn = QPushButton("Copy Matches to...")
         self.copy_btn.clicked.connect(self.copy_matches)
         self.copy_btn.setEnabled(False)
@@ -136,6 +440,27 @@ class FaceMatcherApp(QWidget):
         self.tolerance_spinner.setRange(20, 70)  # map to 0.20 - 0.70
         self.tolerance_spinner.setValue(45)
 
+        self.top_k_label = QLabel("Top K (0 = use tolerance):")
+        self.top_k_spinner = QSpinBox()
+        self.top_k_spinner.setRange(0, 10000)
+        self.top_k_spinner.setValue(0)
+
+        self.workers_label = QLabel("Workers:")
+        self.workers_spinner = QSpinBox()
+        self.workers_spinner.setRange(1, max(1, os.cpu_count() or 1))
+        self.workers_spinner.setValue(max(1, os.cpu_count() or 1))
+
+        self.ann_label = QLabel("ANN probes (0 = exact):")
+        self.ann_spinner = QSpinBox()
+        self.ann_spinner.setRange(0, 1024)
+        self.ann_spinner.setValue(0)
+
+        self.detect_label = QLabel("Detect at max px (0 = full size):")
+        self.detect_spinner = QSpinBox()
+        self.detect_spinner.setRange(0, 8000)
+        self.detect_spinner.setSingleStep(100)
+        self.detect_spinner.setValue(0)
+
         # Status and progress
         self.status_label = QLabel("Ready.")
         self.progress_bar = QProgressBar()
@@ -144,25 +469,49 @@ class FaceMatcherApp(QWidget):
         # List for matches with thumbnails
         self.matches_list = QListWidget()
         self.matches_list.setViewMode(QListWidget.IconMode)
-        self.matches_list.setIconSize(Qt.QSize(160, 160))
+        self.matches_list.setIconSize(QSize(160, 160))
         self.matches_list.setResizeMode(QListWidget.Adjust)
         self.matches_list.setSpacing(10)
 
+        # Identities found by "Index Everyone"; click one to list its images
+        self.identities_list = QListWidget()
+        self.identities_list.setViewMode(QListWidget.IconMode)
+        self.identities_list.setIconSize(QSize(96, 96))
+        self.identities_list.setResizeMode(QListWidget.Adjust)
+        self.identities_list.setMaximumHeight(170)
+        self.identities_list.itemClicked.connect(self._show_identity)
+
         # Layout assembly
         top_row = QHBoxLayout()
         top_row.addWidget(self.select_folder_btn)
         top_row.addWidget(self.select_ref_btn)
+        top_row.addWidget(self.select_ref_folder_btn)
         top_row.addWidget(self.start_btn)
+        top_row.addWidget(self.cluster_btn)
         top_row.addWidget(self.cancel_btn)
         top_row.addWidget(self.copy_btn)
         top_row.addStretch()
-        top_row.addWidget(self.tolerance_label)
-        top_row.addWidget(self.tolerance_spinner)
+
+        options_row = QHBoxLayout()
+        options_row.addWidget(self.tolerance_label)
+        options_row.addWidget(self.tolerance_spinner)
+        options_row.addWidget(self.top_k_label)
+        options_row.addWidget(self.top_k_spinner)
+        options_row.addWidget(self.workers_label)
+        options_row.addWidget(self.workers_spinner)
+        options_row.addWidget(self.ann_label)
+        options_row.addWidget(self.ann_spinner)
+        options_row.addWidget(self.detect_label)
+        options_row.addWidget(self.detect_spinner)
+        options_row.addStretch()
 
         main_layout = QVBoxLayout()
         main_layout.addLayout(top_row)
+        main_layout.addLayout(options_row)
         main_layout.addWidget(self.status_label)
         main_layout.addWidget(self.progress_bar)
+        main_layout.addWidget(QLabel("Identities:"))
+        main_layout.addWidget(self.identities_list)
         main_layout.addWidget(QLabel("Matched Images:"))
         main_layout.addWidget(self.matches_list)
 
@@ -176,13 +525,27 @@ class FaceMatcherApp(QWidget):
             self._enable_start_if_ready()
 
     def select_reference(self):
-        file_path, _ = QFileDialog.getOpenFileName(self, "Select reference image", "", "Images (*.png *.jpg *.jpeg *.bmp)")
-        if file_path:
-            self.reference = file_path
-            self.status_label.setText(f"Reference selected: {Path(file_path).name}")
+        # each selected image is one identity, named after its file
+        file_paths, _ = QFileDialog.getOpenFileNames(self, "Select reference images", "", "Images (*.png *.jpg *.jpeg *.bmp)")
+        if file_paths:
+            self.reference = file_paths
+            self.status_label.setText(f"References selected: {', '.join(Path(p).stem for p in file_paths)}")
+            self._enable_start_if_ready()
+
+    def select_reference_folder(self):
+        # one identity per subfolder (several photos of the same person) or per top-level image
+        folder = QFileDialog.getExistingDirectory(self, "Select folder of reference identities")
+        if folder:
+            names = list(load_identities(folder))
+            if not names:
+                QMessageBox.warning(self, "No references", "No reference images found in that folder.")
+                return
+            self.reference = folder
+            self.status_label.setText(f"{len(names)} identities selected: {', '.join(names)}")
             self._enable_start_if_ready()
 
     def _enable_start_if_ready(self):
+        self.cluster_btn.setEnabled(bool(self.folder))
         if self.folder and self.reference:
             self.start_btn.setEnabled(True)
         else:
@@ -190,47 +553,120 @@ class FaceMatcherApp(QWidget):
 
     def start_scan(self):
         if not (self.folder and self.reference):
-            QMessageBox.warning(self, "Missing input", "Please select both folder and reference image.")
+            QMessageBox.warning(self, "Missing input", "Please select both folder and reference images.")
             return
 
         tolerance = self.tolerance_spinner.value() / 100.0
+        top_k = self.top_k_spinner.value() or None
+        workers = self.workers_spinner.value()
+        ann_nprobe = self.ann_spinner.value()
+        detect_max_side = self.detect_spinner.value() or None
         # clear previous results
         self.matches_list.clear()
         self.matched_paths = []
         # set buttons
         self.start_btn.setEnabled(False)
+        self.cluster_btn.setEnabled(False)
         self.cancel_btn.setEnabled(True)
         self.copy_btn.setEnabled(False)
 
         # create and start worker thread
-        self.matcher_thread = MatcherThread(self.folder, self.reference, tolerance=tolerance)
-        self.matcher_thread.progress.connect(self.progress_bar.setValue)
+        self.matcher_thread = MatcherThread(self.folder, self.reference, tolerance=tolerance,
+                                            top_k=top_k, workers=workers, ann_nprobe=ann_nprobe,
+                                            detect_max_side=detect_max_side, thumbs=self.thumbs)
+        # total is unknown while the folder is streamed: show a busy bar plus a running count
+        self.progress_bar.setRange(0, 0)
+        self.matcher_thread.progress.connect(self._set_scanned_count)
         self.matcher_thread.status.connect(self._set_status)
         self.matcher_thread.matched.connect(self._add_match_item)
         self.matcher_thread.finished_signal.connect(self._scan_finished)
         self.matcher_thread.start()
         self._set_status("Started scanning...")
 
+    def start_clustering(self):
+        if not self.folder:
+            QMessageBox.warning(self, "Missing input", "Please select a folder.")
+            return
+
+        self.identities_list.clear()
+        self.matches_list.clear()
+        self.matched_paths = []
+        self.clusters = None
+        self.start_btn.setEnabled(False)
+        self.cluster_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(True)
+        self.copy_btn.setEnabled(False)
+
+        # reference images, if any, are looked up in the clusters and shown by name
+        self.matcher_thread = ClusterThread(self.folder, self.reference,
+                                            tolerance=self.tolerance_spinner.value() / 100.0,
+                                            workers=self.workers_spinner.value(),
+                                            detect_max_side=self.detect_spinner.value() or None,
+                                            thumbs=self.thumbs)
+        self.progress_bar.setRange(0, 0)
+        self.matcher_thread.progress.connect(self._set_scanned_count)
+        self.matcher_thread.status.connect(self._set_status)
+        self.matcher_thread.identity_found.connect(self._add_identity_item)
+        self.matcher_thread.clusters_ready.connect(self._set_clusters)
+        self.matcher_thread.finished_signal.connect(self._clustering_finished)
+        self.matcher_thread.start()
+        self._set_status("Indexing everyone...")
+
+    def _add_identity_item(self, identity, name, pixmap, n_images):
+        item = QListWidgetItem(QIcon(pixmap), f"{name} ({n_images})")
+        item.setData(Qt.UserRole, (identity, name))
+        self.identities_list.addItem(item)
+
+    def _set_clusters(self, clusters):
+        self.clusters = clusters
+
+    def _show_identity(self, item):
+        if self.clusters is None:
+            return
+        identity, name = item.data(Qt.UserRole)
+        self.matches_list.clear()
+        self.matched_paths = []
+        for path in self.clusters.members(identity):
+            self.matched_paths.append((name, path))
+            list_item = QListWidgetItem(QIcon(make_pixmap(self.thumbs, path, 200)), f"{name}: {Path(path).name}")
+            list_item.setToolTip(path)
+            self.matches_list.addItem(list_item)
+        self.copy_btn.setEnabled(bool(self.matched_paths))
+        self._set_status(f"{name}: {len(self.matched_paths)} images.")
+
+    def _clustering_finished(self, _):
+        self._reset_controls()
+        self.copy_btn.setEnabled(bool(self.matched_paths))
+
     def cancel_scan(self):
         if self.matcher_thread:
             self.matcher_thread.stop()
             self._set_status("Stopping...")
 
+    def _set_scanned_count(self, count):
+        self.progress_bar.setFormat(f"{count} images scanned")
+
     def _set_status(self, text):
         self.status_label.setText(text)
 
-    def _add_match_item(self, path, pixmap):
-        self.matched_paths.append(path)
-        item = QListWidgetItem(QIcon(pixmap), Path(path).name)
-        item.setToolTip(path)
+    def _add_match_item(self, path, pixmap, distance, identity):
+        self.matched_paths.append((identity, path))
+        item = QListWidgetItem(QIcon(pixmap), f"{identity}: {Path(path).name} ({distance:.2f})")
+        item.setToolTip(f"{path}\nidentity: {identity}\ndistance: {distance:.3f}")
         self.matches_list.addItem(item)
 
     def _scan_finished(self, matched_list):
-        self._set_status(f"Scan finished. {len(matched_list)} matches found.")
+        identities = len(set(identity for identity, _ in self.matched_paths))
+        self._set_status(f"Scan finished. {len(matched_list)} matching images for {identities} identities.")
+        self._reset_controls()
+        self.copy_btn.setEnabled(bool(matched_list))
+
+    def _reset_controls(self):
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setFormat("%p%")
         self.progress_bar.setValue(100)
-        self.start_btn.setEnabled(True)
+        self._enable_start_if_ready()
         self.cancel_btn.setEnabled(False)
-        self.copy_btn.setEnabled(bool(matched_list))
 
     def copy_matches(self):
         if not self.matched_paths:
@@ -243,14 +679,18 @@ class FaceMatcherApp(QWidget):
 
         copied = 0
         errors = []
-        for p in self.matched_paths:
+        # with several identities, each one gets its own subfolder
+        per_identity = len(set(identity for identity, _ in self.matched_paths)) > 1
+        for identity, p in self.matched_paths:
             try:
-                dest = Path(target) / Path(p).name
+                dest_dir = Path(target) / identity if per_identity else Path(target)
+                dest_dir.mkdir(exist_ok=True)
+                dest = dest_dir / Path(p).name
                 # avoid overwriting: if exists, append index
                 i = 1
                 dest_name = dest
                 while dest_name.exists():
-                    dest_name = Path(target) / (Path(p).stem + f"_{i}" + Path(p).suffix)
+                    dest_name = dest_dir / (Path(p).stem + f"_{i}" + Path(p).suffix)
                     i += 1
                 shutil.copy2(p, str(dest_name))
                 copied += 1
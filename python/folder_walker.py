@@ -0,0 +1,79 @@
+"""
+folder_walker.py
+
+Streaming, recursive image walker with background prefetching, shared by the face scanners.
+
+How it works (summary):
+  - iter_images() walks a folder tree with os.scandir and yields image paths as it
+    finds them, so scanning starts immediately even on folders with millions of files.
+  - prefetch() runs a load function (e.g. decoding) for the next `depth` items on a
+    small I/O thread pool and yields results in the original order, so the CPU-bound
+    consumer never waits on disk. The default depth is one item per thread plus one,
+    since every item in flight may hold a whole decoded image.
+  - The input iterator of prefetch() is advanced in the consumer's thread, so it may
+    do per-thread work such as SQLite cache lookups.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+_DONE = object()
+
+
+def iter_images(root, exts=IMAGE_EXTS, recursive=True):
+    """Yield paths (str) of image files under `root`, lazily. Hidden files and folders are skipped."""
+    stack = [str(root)]
+    while stack:
+        folder = stack.pop()
+        try:
+            entries = os.scandir(folder)
+        except OSError:
+            continue    # unreadable folder: skip it
+        subdirs = []
+        with entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            subdirs.append(entry.path)
+                    elif entry.name.lower().endswith(exts):
+                        yield entry.path
+                except OSError:
+                    continue
+        # visit subfolders in name order after finishing the current one
+        stack.extend(sorted(subdirs, reverse=True))
+
+
+def prefetch(items, load, workers=4, depth=None):
+    """
+    Yield (item, load(item)) for each item, in order, while up to `depth` later items
+    (default workers + 1) are already loading on `workers` threads. Exceptions from
+    load() are yielded in place of the result. Closing the generator cancels queued work.
+    """
+    if depth is None:
+        depth = workers + 1
+    pending = deque()
+    todo = iter(items)
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            while len(pending) < depth:
+                item = next(todo, _DONE)
+                if item is _DONE:
+                    break
+                pending.append((item, pool.submit(load, item)))
+            if not pending:
+                return
+            item, future = pending.popleft()
+            try:
+                result = future.result()
+            except Exception as e:
+                result = e
+            yield item, result
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
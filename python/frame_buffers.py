@@ -0,0 +1,160 @@
+"""
+frame_buffers.py
+
+Preallocated frame buffers for the counters' per-frame processing.
+
+Requirements:
+  pip install opencv-python numpy
+
+How it works (summary):
+  - FrameBuffers keeps one NumPy array per named slot ("small", "gray", ...) and
+    has cv2.resize / cv2.cvtColor write into it through dst=, so a steady stream of
+    same-sized frames allocates no new image memory. A slot is reallocated only when
+    the frame size changes (e.g. the adaptive controller picks another width).
+  - A returned buffer is overwritten by the next call for the same slot: use it for
+    the current frame only, and keep one FrameBuffers per thread.
+  - Detectors return boxes as (N, 4) int32 arrays (boxes.as_boxes) instead of lists of
+    tuples, and tracker.MultiTracker publishes its tracks as ids + boxes arrays, so no
+    per-box Python objects are created between detection, tracking and drawing.
+
+Benchmark (steady-state allocations per frame of the whole loop: resize, gray, box merge,
+tracking every frame with a detection every 5th, drawing; fresh arrays and tuples vs
+preallocated buffers and arrays, via tracemalloc):
+  python frame_buffers.py --frames 300
+"""
+
+import time
+import argparse
+import itertools
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from boxes import as_boxes, scale_boxes, weighted_nms
+from tracker import MultiTracker
+
+
+class FrameBuffers:
+    def __init__(self):
+        self._slots = {}
+
+    def get(self, name, shape, dtype=np.uint8):
+        buf = self._slots.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = self._slots[name] = np.empty(shape, dtype)
+        return buf
+
+    def resize(self, name, src, width, interpolation=cv2.INTER_LINEAR):
+        """`src` resized to `width` px wide (aspect kept), written into slot `name`."""
+        height = int(src.shape[0] * width / src.shape[1])
+        dst = self.get(name, (height, width) + src.shape[2:], src.dtype)
+        cv2.resize(src, (width, height), dst=dst, interpolation=interpolation)
+        return dst
+
+    def scale(self, name, src, fx, fy=None):
+        """`src` scaled by fx/fy like cv2.resize(src, (0, 0), fx=fx, fy=fy), written into slot `name`."""
+        fy = fx if fy is None else fy
+        width, height = int(round(src.shape[1] * fx)), int(round(src.shape[0] * fy))
+        dst = self.get(name, (height, width) + src.shape[2:], src.dtype)
+        cv2.resize(src, (width, height), dst=dst)
+        return dst
+
+    def gray(self, name, src):
+        """Grayscale copy of the BGR image `src` in slot `name` (`src` itself if already gray)."""
+        if src.ndim == 2:
+            return src
+        dst = self.get(name, src.shape[:2], src.dtype)
+        cv2.cvtColor(src, cv2.COLOR_BGR2GRAY, dst=dst)
+        return dst
+
+
+# ---------- benchmark ----------
+def _fake_detections(rng, n=12):
+    # stands in for HOG output: jittered boxes around a few people, with scores
+    centres = rng.integers(50, 500, size=(3, 2))
+    xy = centres[rng.integers(0, 3, n)] + rng.integers(-6, 7, size=(n, 2))
+    return np.column_stack([xy, np.full((n, 2), (64, 128))]).astype(np.int32), rng.random(n)
+
+
+def _track(tracker, frames, boxes, detect_every=5):
+    # detection every Nth frame, the tracker's motion model in between (as people_counter.py)
+    if next(frames) % detect_every == 0:
+        tracker.update(None, boxes)
+    else:
+        tracker.predict()
+
+
+def _legacy_frame(frame, rng, tracker, frames):
+    # what the loops did before: fresh arrays every frame, boxes and tracks as lists of tuples
+    scale = 640 / frame.shape[1]
+    small = cv2.resize(frame, (640, int(frame.shape[0] * scale)))
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    rects, scores = _fake_detections(rng)
+    persons = [(int(x), int(y), int(w), int(h)) for (x, y, w, h) in rects]
+    merged, _ = weighted_nms(persons, scores, 0.4)
+    merged = [tuple(b) for b in merged.tolist()]
+    _track(tracker, frames, merged)
+    tracks = [(i, tuple(box)) for i, box in zip(tracker.ids.tolist(), tracker.boxes.tolist())]
+    for track_id, (x, y, w, h) in tracks:
+        cv2.rectangle(small, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        cv2.putText(small, f"Person #{track_id}", (x, y - 6), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+    hints = scale_boxes([box for _, box in tracks], 1 / scale, 1 / scale)
+    return gray, merged, hints
+
+
+def _buffered_frame(frame, rng, buffers, tracker, frames):
+    small = buffers.resize("small", frame, 640)
+    gray = buffers.gray("gray", small)
+    rects, scores = _fake_detections(rng)
+    merged, _ = weighted_nms(as_boxes(rects), scores, 0.4)
+    _track(tracker, frames, merged)
+    for track_id, (x, y, w, h) in zip(tracker.ids.tolist(), tracker.boxes.tolist()):
+        cv2.rectangle(small, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        cv2.putText(small, f"Person #{track_id}", (x, y - 6), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+    to_frame = frame.shape[1] / small.shape[1]
+    hints = scale_boxes(tracker.boxes, to_frame, to_frame)
+    return gray, merged, hints
+
+
+def _measure(step, frames, warmup=20):
+    for frame in frames[:warmup]:
+        step(frame)
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        peaks = []
+        t0 = time.perf_counter()
+        for frame in frames:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            step(frame)
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        elapsed = time.perf_counter() - t0
+        retained = tracemalloc.get_traced_memory()[0] - base
+    finally:
+        tracemalloc.stop()
+    return np.mean(peaks), np.max(peaks), retained, elapsed / len(frames) * 1000
+
+
+def benchmark(n_frames=300, size=(720, 1280)):
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 255, size + (3,), dtype=np.uint8) for _ in range(4)]
+    frames = [frames[i % len(frames)] for i in range(n_frames)]
+    buffers = FrameBuffers()
+    print(f"{n_frames} frames of {size[1]}x{size[0]} -> 640 px + gray + box merge + track + draw "
+          f"(tracemalloc, steady state)")
+    print(f"{'mode':<12} {'mean KiB/frame':>15} {'max KiB/frame':>14} {'retained KiB':>13} {'ms/frame':>9}")
+    legacy = (MultiTracker(), itertools.count())
+    buffered = (MultiTracker(), itertools.count())
+    for name, step in (("fresh", lambda f: _legacy_frame(f, rng, *legacy)),
+                       ("preallocated", lambda f: _buffered_frame(f, rng, buffers, *buffered))):
+        mean, peak, retained, ms = _measure(step, frames)
+        print(f"{name:<12} {mean / 1024:15.1f} {peak / 1024:14.1f} {retained / 1024:13.1f} {ms:9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure per-frame allocations with and without preallocated buffers.")
+    parser.add_argument("--frames", type=int, default=300)
+    args = parser.parse_args()
+    benchmark(args.frames)
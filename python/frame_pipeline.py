@@ -0,0 +1,311 @@
+"""
+frame_pipeline.py
+
+Threaded capture -> detect -> render pipeline for the webcam counters.
+
+Requirements:
+  pip install opencv-python numpy
+
+How it works (summary):
+  - A capture thread reads the camera continuously and keeps only the latest frame,
+    so the camera buffer never backs up behind slow detection.
+  - A small pool of detection workers each take the newest frame that nobody has
+    claimed yet, run the detector and push the result into a bounded queue
+    (the oldest result is dropped when it is full).
+  - The render/UI loop (the main thread, which OpenCV's imshow needs) shows every new
+    camera frame with the most recent detection result, so video stays smooth while
+    detection runs at its own rate.
+  - With detect_every=N, workers only take frames at least N frames after the last
+    one detected; callers track objects on the frames in between (tracker.py).
+  - An optional gate (motion_gate.MotionGate) sees each claimed frame first; frames
+    it rejects are not detected and `static` is set until motion returns.
+  - With roi=True (needs a gate), a frame let through by motion is detected as
+    detector(frame, rois): rois are the gate's motion blobs plus the caller's current
+    `track_boxes`, in full-frame pixels. Keepalive frames are still scanned whole.
+  - StageStats keeps rolling per-stage latency (mean, p50/p95/p99) and FPS counters,
+    plus running totals for metrics.py; FrameDrops counts camera frames the display
+    loop never showed.
+"""
+
+import time
+import queue
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+from boxes import as_boxes
+
+
+class StageStats:
+    """Rolling latency / FPS counters per pipeline stage (thread-safe)."""
+
+    def __init__(self, window=120):
+        self.window = window
+        self._samples = {}
+        self._totals = {}               # stage -> [count, total seconds] since start
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            samples = self._samples.setdefault(stage, deque(maxlen=self.window))
+            samples.append((time.perf_counter(), seconds))
+            totals = self._totals.setdefault(stage, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+
+    @contextmanager
+    def timer(self, stage):
+        """with stats.timer("hog"): ... records the block's wall time under `stage`."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - t0)
+
+    def summary(self):
+        """
+        {stage: {"fps", "latency_ms", "p50_ms", "p95_ms", "p99_ms", "count", "total_s"}}:
+        rate, mean and percentile latency over the window; count and total_s since start.
+        """
+        with self._lock:
+            snapshot = {stage: list(s) for stage, s in self._samples.items()}
+            totals = {stage: tuple(t) for stage, t in self._totals.items()}
+        out = {}
+        for stage, samples in snapshot.items():
+            span = samples[-1][0] - samples[0][0]
+            fps = (len(samples) - 1) / span if span > 0 else 0.0
+            durations = np.array([d for _, d in samples]) * 1000
+            p50, p95, p99 = np.percentile(durations, (50, 95, 99))
+            out[stage] = {"fps": fps, "latency_ms": durations.mean(), "p50_ms": p50, "p95_ms": p95, "p99_ms": p99,
+                          "count": totals[stage][0], "total_s": totals[stage][1]}
+        return out
+
+    def format(self, stages=None):
+        """One line of fps/mean latency, for all stages or just `stages`."""
+        return "  ".join(f"{stage}: {v['fps']:.1f}fps {v['latency_ms']:.1f}ms"
+                         for stage, v in self.summary().items() if stages is None or stage in stages)
+
+    def report(self):
+        """Table of per-stage rate and p50/p95/p99 latency."""
+        lines = [f"{'stage':<14} {'fps':>6} {'mean ms':>8} {'p50':>7} {'p95':>7} {'p99':>7} {'count':>7}"]
+        for stage, v in self.summary().items():
+            lines.append(f"{stage:<14} {v['fps']:6.1f} {v['latency_ms']:8.2f} {v['p50_ms']:7.2f} "
+                         f"{v['p95_ms']:7.2f} {v['p99_ms']:7.2f} {v['count']:7d}")
+        return "\n".join(lines)
+
+
+class FrameDrops:
+    """
+    Camera frames a display loop missed. With capture sequence numbers these are the
+    gaps between shown frames; without them, each loop iteration longer than the camera's
+    frame `interval` counts the frames that fit in the extra time.
+    """
+
+    def __init__(self, interval=1 / 30):
+        self.interval = interval
+        self.shown = 0
+        self.dropped = 0
+        self._last_seq = None
+        self._last_time = None
+
+    def tick(self, seq=None):
+        now = time.perf_counter()
+        if seq is not None:
+            if self._last_seq is not None:
+                self.dropped += max(0, seq - self._last_seq - 1)
+            self._last_seq = seq
+        elif self._last_time is not None:
+            self.dropped += max(0, int((now - self._last_time) / self.interval) - 1)
+        self._last_time = now
+        self.shown += 1
+
+    def report(self):
+        total = self.shown + self.dropped
+        pct = 100.0 * self.dropped / total if total else 0.0
+        return f"display: showed {self.shown} frames, dropped {self.dropped} ({pct:.1f}%)"
+
+
+class LatestFrame:
+    """
+    Capture thread that keeps only the newest frame of a cv2.VideoCapture.
+    `on_frame`, if given, is called (without arguments) after every new frame.
+    """
+
+    def __init__(self, cap, stats=None, on_frame=None):
+        self.cap = cap
+        self.stats = stats or StageStats()
+        self.on_frame = on_frame
+        self.seq = 0
+        self.frame = None
+        self.stamp = 0.0                # perf_counter() when the frame was captured
+        self.ended = False
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._running = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        self._thread.join(timeout=1.0)
+
+    def _run(self):
+        while self._running:
+            t0 = time.perf_counter()
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            self.stats.record("capture", time.perf_counter() - t0)
+            with self._cond:
+                self.seq += 1
+                self.frame = frame
+                self.stamp = time.perf_counter()
+                self._cond.notify_all()
+            if self.on_frame is not None:
+                self.on_frame()
+        with self._cond:
+            self.ended = True
+            self._cond.notify_all()
+        if self.on_frame is not None:
+            self.on_frame()
+
+    def latest(self):
+        """(seq, frame, stamp) of the newest frame, without waiting."""
+        with self._cond:
+            return self.seq, self.frame, self.stamp
+
+    def wait_newer(self, seq, timeout=1.0):
+        """Block until a frame newer than `seq` exists. Returns (seq, frame), or (seq, None) at the end."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.seq > seq or self.ended or not self._running, timeout)
+            if self.seq > seq:
+                return self.seq, self.frame
+            return seq, None
+
+
+class DetectionPipeline:
+    """
+    Runs `make_detector()` instances on `workers` threads over the newest camera frames.
+    Each worker builds its own detector, because OpenCV detectors are not shared safely.
+    stop() calls close() on the detectors that have one (e.g. PeopleDetector's helper pool).
+    """
+
+    def __init__(self, cap, make_detector, workers=2, queue_size=2, detect_every=1, gate=None, roi=False,
+                 stats=None):
+        self.stats = stats or StageStats()
+        self.frames = LatestFrame(cap, self.stats)
+        self.make_detector = make_detector
+        self.workers = workers
+        self.detect_every = max(1, detect_every)
+        self.gate = gate
+        self.static = False             # the gate rejected the last claimed frame
+        self.roi = roi and gate is not None
+        self.track_boxes = []           # set by the caller: boxes being tracked, in full-frame pixels
+        self.results = queue.Queue(maxsize=queue_size)
+        self.latest_result = None       # (seq, frame, result) of the newest finished detection
+        self._claimed = 1 - self.detect_every  # newest frame seq handed to a worker (so frame 1 is taken)
+        self._claim_lock = threading.Lock()
+        self._running = False
+        self._threads = []
+        self._detectors = []            # built by the workers, closed by stop()
+
+    def start(self):
+        self._running = True
+        self.frames.start()
+        for _ in range(self.workers):
+            t = threading.Thread(target=self._detect_loop, daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self):
+        self._running = False
+        self.frames.stop()
+        for t in self._threads:
+            t.join(timeout=1.0)
+        with self._claim_lock:
+            detectors, self._detectors = self._detectors, []
+        for detector in detectors:
+            close = getattr(detector, "close", None)
+            if close is not None:
+                close()
+
+    @property
+    def ended(self):
+        return self.frames.ended
+
+    def _claim(self):
+        """Newest frame not yet taken by another worker, at least detect_every frames after the last."""
+        while self._running:
+            seq, frame = self.frames.wait_newer(self._claimed + self.detect_every - 1, timeout=0.5)
+            if frame is None:
+                if self.frames.ended:
+                    return None, None, None
+                continue
+            with self._claim_lock:
+                if seq >= self._claimed + self.detect_every:
+                    self._claimed = seq
+                    if self.gate is not None:
+                        self.static = not self.gate(frame)
+                        if self.static:
+                            continue
+                    return seq, frame, self._rois(frame)
+        return None, None, None
+
+    def _rois(self, frame):
+        """Regions to restrict detection to, or None for a full-frame pass."""
+        if not self.roi:
+            return None
+        motion = self.gate.regions(frame.shape)
+        if motion is None:
+            return None
+        return np.vstack([as_boxes(self.track_boxes), motion])
+
+    def _detect_loop(self):
+        detector = self.make_detector()
+        with self._claim_lock:
+            self._detectors.append(detector)
+        while self._running:
+            seq, frame, rois = self._claim()
+            if frame is None:
+                return
+            t0 = time.perf_counter()
+            result = detector(frame) if rois is None else detector(frame, rois)
+            elapsed = time.perf_counter() - t0
+            self.stats.record("detect", elapsed)
+            if self.gate is not None:
+                with self._claim_lock:
+                    self.gate.record_detection(elapsed)
+            item = (seq, frame, result)
+            while True:
+                try:
+                    self.results.put_nowait(item)
+                    break
+                except queue.Full:
+                    # bounded queue: drop the oldest result rather than block detection
+                    try:
+                        self.results.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def poll_result(self):
+        """Newest detection result finished since the last call (older ones are skipped), or None."""
+        newest = None
+        while True:
+            try:
+                item = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if newest is None or item[0] > newest[0]:
+                newest = item
+        if newest is not None and (self.latest_result is None or newest[0] > self.latest_result[0]):
+            self.latest_result = newest
+            return newest
+        return None
@@ -0,0 +1,138 @@
+"""
+metrics.py
+
+Metrics surface for the realtime counters: periodic stage summaries, Prometheus
+text on a local port and an optional cProfile dump.
+
+Requirements:
+  standard library only (the stats come from frame_pipeline.StageStats)
+
+How it works (summary):
+  - The counters time their stages into a frame_pipeline.StageStats (capture, resize,
+    detect_resize, haar, hog, merge, track, draw, show, announce, speak, ...), which
+    keeps a rolling window per stage for p50/p95/p99 latency and running totals.
+  - MetricsReporter reads that StageStats from its own threads, so the video loop
+    never formats or serves anything itself:
+      interval : print the p50/p95/p99 table every `interval` seconds
+      port     : serve GET /metrics as Prometheus text (a summary per stage:
+                 counter_stage_latency_seconds{stage="hog",quantile="0.95"}, plus
+                 _count / _sum since start and a counter_stage_fps gauge)
+  - profiled(path) wraps the run in cProfile and dumps the stats to `path` on exit
+    (view with `python -m pstats path` or snakeviz). cProfile only sees the thread
+    that enabled it (the display loop); detection threads are covered by the timers.
+
+Run (any counter):
+  python people_counter.py --metrics 5 --metrics-port 9100 --profile people.prof
+  curl http://127.0.0.1:9100/metrics
+"""
+
+import time
+import cProfile
+import pstats
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUANTILES = (("0.5", "p50_ms"), ("0.95", "p95_ms"), ("0.99", "p99_ms"))
+
+
+def prometheus_text(stats, prefix="counter"):
+    """Prometheus text exposition (format 0.0.4) of a StageStats."""
+    summary = stats.summary()
+    name = f"{prefix}_stage_latency_seconds"
+    lines = [f"# HELP {name} Wall time per pipeline stage (quantiles over the rolling window).",
+             f"# TYPE {name} summary"]
+    for stage, v in summary.items():
+        for quantile, key in QUANTILES:
+            lines.append(f'{name}{{stage="{stage}",quantile="{quantile}"}} {v[key] / 1000:.6f}')
+        lines.append(f'{name}_count{{stage="{stage}"}} {v["count"]}')
+        lines.append(f'{name}_sum{{stage="{stage}"}} {v["total_s"]:.6f}')
+    fps = f"{prefix}_stage_fps"
+    lines += [f"# HELP {fps} Events per second per pipeline stage over the rolling window.",
+              f"# TYPE {fps} gauge"]
+    lines += [f'{fps}{{stage="{stage}"}} {v["fps"]:.3f}' for stage, v in summary.items()]
+    return "\n".join(lines) + "\n"
+
+
+def make_handler(stats, prefix="counter"):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") not in ("", "/metrics"):
+                self.send_error(404)
+                return
+            body = prometheus_text(stats, prefix).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass    # keep the console for the counter
+
+    return MetricsHandler
+
+
+class MetricsReporter:
+    def __init__(self, stats, interval=None, port=None, host="127.0.0.1", prefix="counter"):
+        self.stats = stats
+        self.interval = interval
+        self.port = port
+        self.host = host
+        self.prefix = prefix
+        self._stop = threading.Event()
+        self._httpd = None
+        self._thread = None
+
+    def start(self):
+        if self.interval:
+            self._thread = threading.Thread(target=self._print_loop, daemon=True)
+            self._thread.start()
+        if self.port is not None:
+            self._httpd = ThreadingHTTPServer((self.host, self.port), make_handler(self.stats, self.prefix))
+            threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+            print(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+        return self
+
+    def _print_loop(self):
+        while not self._stop.wait(self.interval):
+            print(time.strftime("%H:%M:%S"), "stage latency (ms):")
+            print(self.stats.report())
+
+    def stop(self):
+        self._stop.set()
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+
+
+@contextmanager
+def profiled(path=None, top=15):
+    """cProfile the enclosed block (this thread only) and dump to `path`; no-op when path is None."""
+    if path is None:
+        yield
+        return
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
+        print(f"Profile written to {path}; top {top} by cumulative time:")
+        pstats.Stats(profile).sort_stats("cumulative").print_stats(top)
+
+
+def add_metrics_arguments(parser):
+    parser.add_argument("--metrics", type=float, metavar="SECONDS",
+                        help="print per-stage p50/p95/p99 latency every SECONDS")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--profile", metavar="FILE", help="write a cProfile dump of the display loop to FILE on exit")
+
+
+def start_metrics(args, stats, prefix="counter"):
+    """MetricsReporter for the parsed --metrics / --metrics-port options (started), or None."""
+    if not args.metrics and args.metrics_port is None:
+        return None
+    return MetricsReporter(stats, interval=args.metrics, port=args.metrics_port, prefix=prefix).start()
@@ -7,170 +7,393 @@ Requirements:
 How it works (summary):
   - Uses OpenCV Haar cascade to detect faces.
   - Uses OpenCV HOG+SVM people detector for full-body detections.
-  - Merges overlapping detections (simple IoU-based merging).
+  - Merges overlapping detections (score-weighted NMS on the HOG weights,
+    or the original IoU-based union merging; see MERGE_METHOD).
   - Chooses a conservative count (max of unique faces and unique merged person boxes).
-  - Announces count with pyttsx3 TTS and shows bounding boxes on video.
+  - Announces count with pyttsx3 TTS and shows bounding boxes on video. Speech runs on
+    its own thread (announcer.py) and only the newest count is spoken, so the display
+    never waits for audio (BLOCKING_TTS = True restores the old behaviour to compare
+    the dropped-frame stats printed on exit).
+  - Capture, detection and display run as a threaded pipeline (frame_pipeline.py):
+    the camera is read on its own thread keeping only the latest frame, detection
+    runs on DETECT_WORKERS threads at its own rate, and the display shows every frame
+    with the newest detection result. Per-stage FPS/latency is drawn on the video.
+  - Detection only runs on every DETECT_EVERY-th camera frame; faces and persons are
+    tracked in between (tracker.py). The count is taken from the tracks, which keeps it
+    steady across missed detections, and tracks carry ids, so the overlay also shows
+    how many different people have been seen.
+  - A motion gate (motion_gate.py, MOG2 on a tiny frame) skips detection and tracking
+    while the room is static; skipped frames and CPU saved are printed on exit.
+  - ROI mode: when motion triggers a detection, Haar and HOG only scan padded crops
+    around the motion blobs and the current tracks (mapped to detection coordinates
+    with boxes.scale_boxes, the same corner scaling face_counter.py uses), unless the
+    crops cover most of the frame. Keepalive detections still scan the whole frame.
+  - DETECTOR_BACKEND picks the detector (detectors.py): "haar+hog" is
+    PeopleDetector (built by people_detector() with the settings below); "ssd", "yunet"
+    or "ssd+yunet" use OpenCV DNN models on the same DETECT_WIDTH frame (ROI mode only applies to "haar+hog").
+  - With ADAPTIVE, a feedback controller (adaptive.py) picks the detection width and the
+    Haar scaleFactor / HOG winStride to keep detection at TARGET_DETECT_FPS, scaling
+    back up when there is headroom. Boxes are mapped back to the DETECT_WIDTH display
+    frame; the chosen settings and achieved FPS are drawn on the video.
+  - Within one frame, Haar and HOG run concurrently (OpenCV releases the GIL in both),
+    so per-frame detection latency is about the slower of the two, not their sum.
+  - The resized and grayscale frames are written into preallocated buffers
+    (frame_buffers.py) and boxes stay (N, 4) int32 arrays from the detectors through
+    the trackers (ids + boxes arrays) to scaling and drawing, so the per-frame loops
+    do not allocate new images or per-box tuples.
+  - Every stage is timed into one StageStats: capture, detect (and inside it
+    detect_resize, haar, hog, merge), track, draw, show, announce and the TTS thread's speak.
+    --metrics N prints p50/p95/p99 per stage every N seconds, --metrics-port serves
+    them as Prometheus text, --profile dumps a cProfile of the display loop (metrics.py).
+  - --headless runs as a service: no window, no drawing and no speech. Counts are
+    published as events (stdout JSONL, a TCP socket or a local HTTP endpoint, see
+    count_events.py), log lines go to stderr, and --save-frames DIR writes one
+    annotated frame per --save-every seconds. --events also works with the window.
 
 Run:
   python people_counter.py
-Press 'q' to quit.
+  python people_counter.py --metrics 5 --metrics-port 9100 --profile people.prof
+  python people_counter.py --headless --source rtsp://10.0.0.5:554/stream --events http:8081 --save-frames snaps
+Press 'q' to quit (Ctrl+C when headless).
+
+Benchmark (sequential vs concurrent Haar+HOG on recorded video):
+  python people_counter.py --benchmark recording.mp4 --frames 200
 """
 
 import cv2
-import numpy as np
-import pyttsx3
+import sys
 import time
+import argparse
+from contextlib import redirect_stdout
+import numpy as np
+
+from adaptive import AdaptiveResolution
+from announcer import Announcer
+from boxes import scale_boxes
+from count_events import add_headless_arguments, events_from_args, open_source, sampler_from_args
+from detectors import Detection, PeopleDetector, make_detector, resize_for_detection
+from frame_buffers import FrameBuffers
+from frame_pipeline import DetectionPipeline, FrameDrops, StageStats
+from metrics import add_metrics_arguments, profiled, start_metrics
+from tracker import MultiTracker, available_backend
+from motion_gate import MotionGate
+
+# How overlapping HOG boxes are merged: "nms" (score-weighted) or "union" (greedy bounding union)
+MERGE_METHOD = "nms"
+# "haar+hog" (detectors.PeopleDetector) or another detectors.py backend, e.g. "ssd+yunet"
+DETECTOR_BACKEND = "haar+hog"
+# Detection threads; each owns its own detectors
+DETECT_WORKERS = 2
+# Width frames are resized to for display (and detection, unless ADAPTIVE picks another)
+DETECT_WIDTH = 640
+# Adapt detection resolution / coarseness to hold TARGET_DETECT_FPS detections per second per worker
+ADAPTIVE = True
+TARGET_DETECT_FPS = 8
+# Run detection on every Nth camera frame; trackers move the boxes in between
+DETECT_EVERY = 5
+# "kcf", "mosse", "csrt" (need opencv-contrib-python) or "iou"; falls back to "iou"
+TRACKER_BACKEND = "kcf"
+# Detect only around motion and tracks; crops are padded by ROI_PAD of the box size,
+# at least ROI_MIN_SIZE (HOG needs 64x128 plus padding), and dropped for a full-frame
+# pass when they cover more than ROI_MAX_FRACTION of the frame
+ROI_MODE = True
+ROI_PAD = 0.5
+ROI_MIN_SIZE = (96, 160)
+ROI_MAX_FRACTION = 0.6
+# Speak inside the display loop like the original script (for before/after frame-drop comparisons)
+BLOCKING_TTS = False
+
+# Detection boxes are (N, 4) int32 arrays of (x, y, w, h) in the coordinates of the DETECT_WIDTH-wide frame
 
 # --- Utilities ---
-def iou(boxA, boxB):
-    # box = (x, y, w, h)
-    xA = max(boxA[0], boxB[0])
-    yA = max(boxA[1], boxB[1])
-    xB = min(boxA[0]+boxA[2], boxB[0]+boxB[2])
-    yB = min(boxA[1]+boxA[3], boxB[1]+boxB[3])
-    interW = max(0, xB - xA)
-    interH = max(0, yB - yA)
-    interArea = interW * interH
-    boxAArea = boxA[2]*boxA[3]
-    boxBArea = boxB[2]*boxB[3]
-    union = boxAArea + boxBArea - interArea
-    return interArea / union if union > 0 else 0
-
-def merge_boxes(boxes, iou_thresh=0.3):
-    """
-    Merge boxes if IoU > threshold (simple greedy clustering).
-    """
-    boxes = boxes.copy()
-    merged = []
-    while boxes:
-        base = boxes.pop(0)
-        bx, by, bw, bh = base
-        to_merge = []
-        i = 0
-        while i < len(boxes):
-            if iou(base, boxes[i]) > iou_thresh:
-                to_merge.append(boxes.pop(i))
-            else:
-                i += 1
-        # combine base and to_merge into a single bounding box (bounding union)
-        xs = [bx, bx + bw]
-        ys = [by, by + bh]
-        for m in to_merge:
-            xs.append(m[0]); xs.append(m[0]+m[2])
-            ys.append(m[1]); ys.append(m[1]+m[3])
-        x1, x2 = min(xs), max(xs)
-        y1, y2 = min(ys), max(ys)
-        merged.append((x1, y1, x2-x1, y2-y1))
-    return merged
-
-# --- Setup detectors ---
-# Haar cascade for face detection (comes with OpenCV)
-face_cascade_path = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
-face_cascade = cv2.CascadeClassifier(face_cascade_path)
-
-# HOG person detector (works best for standing / upright people)
-hog = cv2.HOGDescriptor()
-hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
-
-# Setup TTS
-tts_engine = pyttsx3.init()
-tts_engine.setProperty('rate', 150)  # speak rate
-last_announced_count = None
-last_announce_time = 0
-announce_interval = 5.0  # seconds between announcements minimum
-
-# Video capture
-cap = cv2.VideoCapture(0)
-if not cap.isOpened():
-    print("ERROR: Could not open webcam. Check device index or drivers.")
-    exit(1)
-
-print("Starting webcam. Press 'q' to quit.")
-
-try:
-    while True:
+def announcement_phrase(count):
+    if count == 0:
+        return "No people detected in the room."
+    elif count == 1:
+        return "One person is present in the room."
+    return f"{count} people are present in the room."
+
+# --- Detectors ---
+def people_detector(concurrent=True, controller=None, stats=None):
+    """detectors.PeopleDetector with the settings above."""
+    return PeopleDetector(concurrent, controller, stats, width=DETECT_WIDTH, merge_method=MERGE_METHOD,
+                          roi_pad=ROI_PAD, roi_min_size=ROI_MIN_SIZE, roi_max_fraction=ROI_MAX_FRACTION)
+
+class BackendDetector:
+    """A detectors.py backend run like PeopleDetector, boxes in DETECT_WIDTH pixels (rois are ignored)."""
+
+    def __init__(self, name=DETECTOR_BACKEND, controller=None, stats=None):
+        self.backend = make_detector(name, warmup=True)
+        self.controller = controller
+        self.stats = stats or StageStats()
+        self.buffers = FrameBuffers()
+
+    def __call__(self, frame, rois=None):
+        t0 = time.perf_counter()
+        width = DETECT_WIDTH
+        if self.controller is not None:
+            settings = self.controller.settings
+            self.backend.configure(settings)
+            width = min(settings.width, frame.shape[1])
+        with self.stats.timer("detect_resize"):
+            frame_small = resize_for_detection(frame, width, self.buffers)
+        with self.stats.timer(self.backend.name):
+            det = self.backend.detect(frame_small)
+        if self.controller is None:
+            return det
+        to_display = DETECT_WIDTH / width
+        det = Detection(scale_boxes(det.faces, to_display, to_display),
+                        scale_boxes(det.persons, to_display, to_display), det.count)
+        self.controller.record(time.perf_counter() - t0)
+        return det
+
+def make_people_detector(controller=None, stats=None):
+    if DETECTOR_BACKEND == "haar+hog":
+        return people_detector(controller=controller, stats=stats)
+    return BackendDetector(DETECTOR_BACKEND, controller, stats)
+
+class TrackedCount:
+    """Face and person trackers fed by PeopleDetector results."""
+
+    def __init__(self, backend="iou"):
+        self.backend = available_backend(backend)
+        self.faces = MultiTracker(self.backend)
+        self.persons = MultiTracker(self.backend)
+
+    @property
+    def needs_frames(self):
+        return self.backend != "iou"
+
+    def update(self, frame_small, detection):
+        self.faces.update(frame_small, detection.faces)
+        self.persons.update(frame_small, detection.persons)
+
+    def predict(self, frame_small):
+        self.faces.predict(frame_small)
+        self.persons.predict(frame_small)
+
+    @property
+    def count(self):
+        # same heuristic as PeopleDetector, over tracks instead of raw detections
+        return max(len(self.faces.ids), len(self.persons.ids))
+
+    @property
+    def unique_count(self):
+        return max(self.faces.unique_count, self.persons.unique_count)
+
+def draw_tracks(frame_small, tracked):
+    # Draw faces (blue) and person boxes (green) on frame_small
+    for person_id, (x,y,w,h) in zip(tracked.persons.ids.tolist(), tracked.persons.boxes.tolist()):
+        cv2.rectangle(frame_small, (x,y), (x+w,y+h), (0,255,0), 2)
+        cv2.putText(frame_small, f"Person #{person_id}", (x, y-6), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0,255,0), 1)
+
+    for face_id, (x,y,w,h) in zip(tracked.faces.ids.tolist(), tracked.faces.boxes.tolist()):
+        cv2.rectangle(frame_small, (x,y), (x+w,y+h), (255,0,0), 2)
+        cv2.putText(frame_small, f"Face #{face_id}", (x, y-6), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255,0,0), 1)
+
+    # Show count on frame
+    text = f"Estimated people: {tracked.count}  (seen: {tracked.unique_count})"
+    cv2.putText(frame_small, text, (10, frame_small.shape[0]-10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0,255,255), 2)
+
+# --- Main loop ---
+def main(args):
+    # Per-stage timings for the overlay, --metrics and the exit summary
+    stats = StageStats(window=500)
+    reporter = start_metrics(args, stats, prefix="people_counter")
+
+    # Setup TTS (a headless service publishes events instead of speaking)
+    announcer = None
+    if not args.headless:
+        announcer = Announcer(configure=lambda engine: engine.setProperty('rate', 150),  # speak rate
+                              blocking=BLOCKING_TTS, stats=stats)
+    last_announced_count = None
+    last_announce_time = 0
+    announce_interval = 5.0  # seconds between announcements minimum
+    events = events_from_args(args, "people_counter")
+    sampler = sampler_from_args(args, "people")
+
+    # Video capture
+    cap = open_source(args.source)
+    if not cap.isOpened():
+        print(f"ERROR: Could not open video source {args.source}. Check device index or drivers.")
+        exit(1)
+
+    # Capture and detection run on background threads from here on
+    gate = MotionGate()
+    controller = AdaptiveResolution(TARGET_DETECT_FPS) if ADAPTIVE else None
+    pipeline = DetectionPipeline(cap, lambda: make_people_detector(controller, stats), workers=DETECT_WORKERS,
+                                 detect_every=DETECT_EVERY, gate=gate, roi=ROI_MODE, stats=stats).start()
+    tracked = TrackedCount(TRACKER_BACKEND)
+    detected_once = False
+    drops = FrameDrops()
+    buffers = FrameBuffers()
+
+    print("Starting headless counter. Press Ctrl+C to stop." if args.headless else f"Reading {args.source}. Press 'q' to quit.")
+
+    seq = 0
+    try:
+        while True:
+            seq, frame = pipeline.frames.wait_newer(seq)
+            if frame is None:
+                if pipeline.ended:
+                    print(f"WARNING: failed to read frame from {args.source}")
+                    break
+                continue
+
+            t0 = time.perf_counter()
+            result = pipeline.poll_result()
+            frame_small = resize_for_detection(frame, DETECT_WIDTH, buffers, name="display")
+            with stats.timer("track"):
+                if result is not None:
+                    det_seq, det_frame, detection = result
+                    if det_seq == seq:
+                        tracked.update(frame_small, detection)
+                    else:
+                        # the detection is for an older frame: re-anchor there, then track to this one
+                        anchor = resize_for_detection(det_frame, DETECT_WIDTH, buffers, name="anchor") if tracked.needs_frames else None
+                        tracked.update(anchor, detection)
+                        tracked.predict(frame_small)
+                    detected_once = True
+                elif not pipeline.static:
+                    tracked.predict(frame_small)
+            # Tell the detectors where people are, in full-frame pixels
+            to_frame = frame.shape[1] / frame_small.shape[1]
+            pipeline.track_boxes = scale_boxes(np.concatenate([tracked.faces.boxes, tracked.persons.boxes]),
+                                               to_frame, to_frame)
+            # Headless: only draw the frames that are sampled to disk
+            save = sampler is not None and sampler.due()
+            if save or not args.headless:
+                with stats.timer("draw"):
+                    draw_tracks(frame_small, tracked)
+
+                    # Per-stage FPS / latency
+                    cv2.putText(frame_small, stats.format(("capture", "detect", "render")), (10, 20),
+                                cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255,255,255), 1)
+                    if controller is not None:
+                        cv2.putText(frame_small, controller.format(), (10, 36), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255,255,255), 1)
+            if save:
+                with stats.timer("save"):
+                    sampler.save(frame_small)
+
+            key = None
+            if not args.headless:
+                with stats.timer("show"):
+                    cv2.imshow("People counter", frame_small)
+                    key = cv2.waitKey(1) & 0xFF
+            stats.record("render", time.perf_counter() - t0)
+            drops.tick(seq)
+
+            if detected_once and events is not None:
+                with stats.timer("publish"):
+                    events.publish(tracked.count, tracked.unique_count, seq)
+
+            # Announce if count changed or if long time passed
+            if detected_once and announcer is not None:
+                est_count = tracked.count
+                now = time.time()
+                should_announce = False
+                if last_announced_count != est_count and (now - last_announce_time) > 1.0:
+                    should_announce = True
+                elif (now - last_announce_time) > announce_interval:
+                    should_announce = True
+
+                if should_announce:
+                    # Announce (non-blocking: replaces any announcement not yet spoken)
+                    with stats.timer("announce"):
+                        announcer.say(announcement_phrase(est_count))
+                    last_announced_count = est_count
+                    last_announce_time = now
+
+            # Key handling
+            if key == ord('q'):
+                break
+
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.stop()
+        if reporter is not None:
+            reporter.stop()
+        print("Pipeline stats:")
+        print(stats.report())
+        print(gate.report())
+        if controller is not None:
+            print("Adaptive resolution:", controller.format(), f"({controller.changes} changes)")
+        print(drops.report())
+        if events is not None:
+            print(events.report())
+            events.close()
+        if sampler is not None:
+            print(f"saved {sampler.saved} frames to {sampler.directory}")
+        cap.release()
+        if not args.headless:
+            cv2.destroyAllWindows()
+        if announcer is not None:
+            print(announcer.report())
+            announcer.stop()
+
+# ---------- benchmark ----------
+def read_frames(video_path, max_frames):
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < max_frames:
         ret, frame = cap.read()
         if not ret:
-            print("WARNING: failed to read frame from webcam")
             break
+        frames.append(frame)
+    cap.release()
+    return frames
 
-        # Resize to speed up (adjust as needed)
-        scale = 640.0 / frame.shape[1]
-        frame_small = cv2.resize(frame, (640, int(frame.shape[0]*scale)))
-
-        gray = cv2.cvtColor(frame_small, cv2.COLOR_BGR2GRAY)
-
-        # 1) Face detection
-        faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30,30))
-        faces_list = [(int(x), int(y), int(w), int(h)) for (x,y,w,h) in faces]
-
-        # 2) HOG person detection
-        # returns rects (x, y, w, h)
-        rects, weights = hog.detectMultiScale(frame_small,
-                                              winStride=(8,8),
-                                              padding=(8,8),
-                                              scale=1.05)
-        persons = [(int(x), int(y), int(w), int(h)) for (x,y,w,h) in rects]
-
-        # Merge person boxes to avoid double-counting
-        merged_persons = merge_boxes(persons, iou_thresh=0.4)
-
-        # Heuristic: the estimated count is max(number of unique faces, number of merged person boxes)
-        # (Faces are more precise for seated/talking people; HOG helps detect whole bodies)
-        est_count = max(len(faces_list), len(merged_persons))
-
-        # Draw faces (blue) and person boxes (green) on frame_small
-        for (x,y,w,h) in merged_persons:
-            cv2.rectangle(frame_small, (x,y), (x+w,y+h), (0,255,0), 2)
-            cv2.putText(frame_small, "Person", (x, y-6), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0,255,0), 1)
-
-        for (x,y,w,h) in faces_list:
-            cv2.rectangle(frame_small, (x,y), (x+w,y+h), (255,0,0), 2)
-            cv2.putText(frame_small, "Face", (x, y-6), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255,0,0), 1)
-
-        # Show count on frame
-        text = f"Estimated people: {est_count}"
-        cv2.putText(frame_small, text, (10, frame_small.shape[0]-10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0,255,255), 2)
-
-        cv2.imshow("People counter", frame_small)
-
-        # Announce if count changed or if long time passed
-        now = time.time()
-        should_announce = False
-        if last_announced_count != est_count and (now - last_announce_time) > 1.0:
-            should_announce = True
-        elif (now - last_announce_time) > announce_interval:
-            should_announce = True
-
-        if should_announce:
-            try:
-                # Compose phrase
-                if est_count == 0:
-                    phrase = "No people detected in the room."
-                elif est_count == 1:
-                    phrase = "One person is present in the room."
-                else:
-                    phrase = f"{est_count} people are present in the room."
-                # Announce (non-blocking)
-                tts_engine.say(phrase)
-                tts_engine.runAndWait()
-            except Exception as e:
-                # if TTS fails, just print
-                print("TTS error:", e)
-                print("Count:", est_count)
-
-            last_announced_count = est_count
-            last_announce_time = now
-
-        # Key handling
-        key = cv2.waitKey(1) & 0xFF
-        if key == ord('q'):
-            break
+def benchmark(video_path, max_frames=200):
+    frames = read_frames(video_path, max_frames)
+    if not frames:
+        print(f"ERROR: no frames could be read from {video_path}")
+        return
+    sequential = people_detector(concurrent=False)
+    concurrent = people_detector(concurrent=True)
 
-finally:
-    cap.release()
-    cv2.destroyAllWindows()
-    try:
-        tts_engine.stop()
-    except Exception:
-        pass
+    # warm up both (first calls allocate OpenCV buffers)
+    sequential(frames[0]); concurrent(frames[0])
+
+    haar_ms, hog_ms = 0.0, 0.0
+    for frame in frames:
+        frame_small = resize_for_detection(frame, DETECT_WIDTH, sequential.buffers)
+        gray = sequential.buffers.gray("gray", frame_small)
+        t0 = time.perf_counter()
+        sequential.detect_faces(gray)
+        t1 = time.perf_counter()
+        sequential.detect_persons(frame_small)
+        t2 = time.perf_counter()
+        haar_ms += (t1 - t0) * 1000
+        hog_ms += (t2 - t1) * 1000
+
+    results = {}
+    for name, detector in (("sequential", sequential), ("concurrent", concurrent)):
+        t0 = time.perf_counter()
+        results[name] = [detector(frame) for frame in frames]
+        results[name + "_ms"] = (time.perf_counter() - t0) * 1000 / len(frames)
+    concurrent.close()
+
+    n = len(frames)
+    print(f"{n} frames from {video_path}")
+    print(f"haar only  : {haar_ms / n:7.2f} ms/frame")
+    print(f"hog only   : {hog_ms / n:7.2f} ms/frame")
+    print(f"sequential : {results['sequential_ms']:7.2f} ms/frame")
+    print(f"concurrent : {results['concurrent_ms']:7.2f} ms/frame  "
+          f"(speedup {results['sequential_ms'] / results['concurrent_ms']:.2f}x)")
+    identical = all(np.array_equal(a, b) for s, c in zip(results["sequential"], results["concurrent"]) for a, b in zip(s, c))
+    print("identical detections:", identical)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Count people in the room from the webcam.")
+    parser.add_argument("--benchmark", metavar="VIDEO", help="benchmark sequential vs concurrent detection on a video file")
+    parser.add_argument("--frames", type=int, default=200, help="frames to benchmark")
+    add_metrics_arguments(parser)
+    add_headless_arguments(parser)
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.benchmark, args.frames)
+    else:
+        # headless: stdout carries only the JSONL events, log lines go to stderr
+        with redirect_stdout(sys.stderr if args.headless else sys.stdout), profiled(args.profile):
+            main(args)
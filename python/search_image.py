@@ -1,15 +1,27 @@
 import os
 import threading
+import cv2
+import numpy as np
 from tkinter import *
 from tkinter import filedialog, messagebox
-from PIL import Image, ImageTk
-from deepface import DeepFace
+from PIL import ImageTk
 from shutil import copy2
 from datetime import datetime
 
+from embedding_store import EmbeddingStore, cached_lookup, index_path_for
+from face_match import match
+from folder_walker import iter_images, prefetch
+from facenet_embedder import COSINE_THRESHOLD, INDEX_FILENAME, BatchEmbedder, cached_represent, represent
+from thumb_cache import ThumbnailCache
+
 def is_image(filename):
     return filename.lower().endswith((".jpg", ".jpeg", ".png", ".bmp", ".webp"))
 
+def read_uncached(lookup):
+    # decode only files the embedding store has no entry for
+    path, _, embs = lookup
+    return cv2.imread(path) if embs is None else None
+
 class FaceScannerApp:
 
     def __init__(self, root):
@@ -23,9 +35,18 @@ class FaceScannerApp:
         self.current_preview = None
         self.preview_label = None  
         self.download_btn = None    # download button initially hidden
+        self.thumbs = ThumbnailCache()
+
+        self.batch_mode = BooleanVar(value=True)
+        self.batch_size = IntVar(value=32)
+        self.embedder = None
+        self.embedder_lock = threading.Lock()
 
         self.create_ui()
 
+        # Load Facenet once in the background so the first batched scan doesn't wait for it
+        threading.Thread(target=self.get_embedder, daemon=True).start()
+
     def create_ui(self):
         canvas = Canvas(self.root)
         scrollbar = Scrollbar(self.root, orient=VERTICAL, command=canvas.yview)
@@ -48,6 +69,12 @@ class FaceScannerApp:
         Entry(self.scroll_frame, textvariable=self.ref_image_path, width=70).pack(anchor="w", padx=10)
         Button(self.scroll_frame, text="Select Reference Image", command=self.select_reference, width=22).pack(anchor="w", padx=10, pady=3)
 
+        # ---- Batched mode ----
+        options = Frame(self.scroll_frame)
+        options.pack(anchor="w", padx=10, pady=3)
+        Checkbutton(options, text="Batched mode (preloaded Facenet), batch size:", variable=self.batch_mode).pack(side=LEFT)
+        Spinbox(options, from_=1, to=256, textvariable=self.batch_size, width=5).pack(side=LEFT)
+
         # Placeholder for preview
         self.preview_placeholder = Frame(self.scroll_frame)
         self.preview_placeholder.pack()
@@ -94,6 +121,31 @@ class FaceScannerApp:
         if path:
             self.ref_image_path.set(path)
 
+    def get_embedder(self):
+        with self.embedder_lock:
+            if self.embedder is None:
+                self.embedder = BatchEmbedder(batch_size=self.batch_size.get())
+            return self.embedder
+
+    def iter_embeddings(self, paths, store):
+        """Yield (path, embeddings or exception) in order, batched or one file at a time."""
+        if self.batch_mode.get():
+            embedder = self.get_embedder()
+            embedder.batch_size = max(1, self.batch_size.get())
+            yield from embedder.embed_paths(paths, store)
+            return
+
+        # decode the next uncached images on I/O threads while DeepFace works on the current one
+        lookups = (cached_lookup(store, p) for p in paths)
+        for (path, _, embs), image in prefetch(lookups, read_uncached):
+            if embs is not None:
+                yield path, embs    # cached embeddings, or the OSError from stat
+                continue
+            try:
+                yield path, cached_represent(store, path, image if isinstance(image, np.ndarray) else None)
+            except Exception as e:
+                yield path, e
+
     def start_scan_thread(self):
         threading.Thread(target=self.start_scan, daemon=True).start()
 
@@ -103,8 +155,7 @@ class FaceScannerApp:
             self.preview_label = Label(self.preview_placeholder, width=250, height=160, bg="#dddddd")
             self.preview_label.pack(padx=10, pady=3)
 
-        img = Image.open(img_path)
-        img = img.resize((250, 160), Image.LANCZOS)
+        img = self.thumbs.get(img_path, (250, 160), fit="resize")
         self.current_preview = ImageTk.PhotoImage(img)
         self.preview_label.config(image=self.current_preview)
 
@@ -126,37 +177,39 @@ class FaceScannerApp:
             messagebox.showerror("Error", "Please select a reference image!")
             return
 
+        # Embed the reference once instead of once per comparison
         try:
-            DeepFace.verify(ref, ref)
+            ref_embs = represent(ref)
         except:
             messagebox.showerror("Error", "Reference image has no detectable face!")
             return
 
-        files = [f for f in os.listdir(folder) if is_image(f)]
-        total = len(files)
+        self.scan_box.insert(END, "Scanning...\n\n")
 
-        if total == 0:
-            messagebox.showinfo("Empty Folder", "No images found.")
-            return
-
-        self.scan_box.insert(END, f"Scanning {total} images...\n\n")
-
-        for i, file in enumerate(files, start=1):
-            path = os.path.join(folder, file)
+        # Per-folder embedding cache: unchanged images are never re-embedded
+        store = EmbeddingStore(index_path_for(folder, INDEX_FILENAME))
 
+        # Images are streamed from the folder tree, so the scan starts right away
+        total = 0
+        for i, (path, embs) in enumerate(self.iter_embeddings(iter_images(folder), store), start=1):
+            total = i
             self.show_preview(path)
 
-            self.scan_box.insert(END, f"{i}/{total}: {file}\n")
+            self.scan_box.insert(END, f"{i}: {os.path.relpath(path, folder)}\n")
             self.scan_box.see(END)
 
-            try:
-                result = DeepFace.verify(ref, path, model_name="Facenet")
-                if result["verified"]:
-                    self.match_box.insert(END, f"MATCH: {path}\n")
-            except:
+            if isinstance(embs, Exception) or not len(embs):
                 self.scan_box.insert(END, " - No face detected\n")
+            elif match(embs, ref_embs, tolerance=COSINE_THRESHOLD, metric="cosine"):
+                self.match_box.insert(END, f"MATCH: {path}\n")
+
+        store.close()
+
+        if total == 0:
+            messagebox.showinfo("Empty Folder", "No images found.")
+            return
 
-        self.scan_box.insert(END, "\nScanning Completed.\n")
+        self.scan_box.insert(END, f"\nScanning Completed. {total} images scanned.\n")
 
         # Show download button now
         self.download_btn.pack(pady=10)
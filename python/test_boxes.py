@@ -0,0 +1,30 @@
+import numpy as np
+
+from boxes import roi_crops
+
+
+def test_roi_crops_in_corners_keep_min_size():
+    # 640x480 frame, small boxes touching each corner
+    boxes = [(0, 0, 20, 30), (620, 450, 20, 30), (0, 450, 20, 30), (620, 0, 20, 30)]
+    crops = roi_crops(boxes, (480, 640, 3), pad=0.5, min_size=(96, 160))
+    assert len(crops) == 4
+    for x, y, w, h in crops.tolist():
+        assert (w, h) == (96, 160)
+        assert 0 <= x and x + w <= 640
+        assert 0 <= y and y + h <= 480
+    assert sorted(map(tuple, crops[:, :2].tolist())) == [(0, 0), (0, 320), (544, 0), (544, 320)]
+
+
+def test_roi_crops_stay_inside_frame():
+    rng = np.random.default_rng(0)
+    xy = rng.integers(-20, 640, size=(200, 2))
+    boxes = np.column_stack([xy, rng.integers(1, 200, size=(200, 2))])
+    for box in boxes:
+        crops = roi_crops([box], (480, 640), pad=0.5, min_size=(96, 160))
+        x, y, w, h = crops[0]
+        assert x >= 0 and y >= 0 and x + w <= 640 and y + h <= 480
+        assert w >= 96 and h >= 160
+
+
+def test_roi_crops_min_size_larger_than_frame():
+    assert roi_crops([(10, 10, 20, 20)], (120, 80), min_size=(96, 160)) is None
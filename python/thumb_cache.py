@@ -0,0 +1,108 @@
+"""
+thumb_cache.py
+
+Shared on-disk thumbnail cache for the face scanner GUIs.
+
+Requirements:
+  pip install pillow
+
+How it works (summary):
+  - A thumbnail is addressed by a hash of (path, mtime, file size, target size, fit),
+    so an edited original automatically gets a new entry.
+  - Thumbnails are small JPEGs under ~/.cache/face_thumbs/<2-char prefix>/.
+  - A cache hit touches the file's mtime; when the cache grows past max_bytes the
+    least recently used files are deleted until it is back under 90% of the budget.
+"""
+
+import os
+import hashlib
+import threading
+from pathlib import Path
+
+from PIL import Image
+
+DEFAULT_DIR = Path.home() / ".cache" / "face_thumbs"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class ThumbnailCache:
+    def __init__(self, cache_dir=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._total = None      # bytes on disk, computed lazily on the first write
+        self._lock = threading.Lock()
+
+    def get(self, path, size, fit="thumbnail"):
+        """
+        Return a PIL image of `path` scaled to `size` (w, h).
+        fit="thumbnail" keeps the aspect ratio inside size, fit="resize" stretches to it.
+        """
+        st = os.stat(path)
+        key = f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}|{size[0]}x{size[1]}|{fit}"
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        cached = self.cache_dir / digest[:2] / f"{digest}.jpg"
+
+        try:
+            im = Image.open(cached)
+            im.load()
+            os.utime(cached)    # mark as recently used
+            return im
+        except (OSError, ValueError):
+            pass
+
+        im = self._render(path, size, fit)
+        self._store(cached, im)
+        return im
+
+    def _render(self, path, size, fit):
+        im = Image.open(path)
+        # JPEG: decode at a reduced scale instead of full resolution
+        im.draft("RGB", (size[0] * 2, size[1] * 2))
+        im = im.convert("RGB")
+        if fit == "resize":
+            return im.resize(size, Image.LANCZOS)
+        im.thumbnail(size, Image.LANCZOS)
+        return im
+
+    def _store(self, cached, im):
+        try:
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cached.with_suffix(f".{threading.get_ident()}.tmp")
+            im.save(tmp, "JPEG", quality=90)
+            try:
+                old_size = cached.stat().st_size     # re-rendered entry: replaced, not added
+            except OSError:
+                old_size = 0
+            os.replace(tmp, cached)
+            with self._lock:
+                if self._total is None:
+                    self._total = sum(size for _, _, size in self._entries())
+                else:
+                    self._total += cached.stat().st_size - old_size
+                if self._total > self.max_bytes:
+                    self._evict()
+        except OSError:
+            pass    # caching is best-effort; the rendered image is still returned
+
+    def _entries(self):
+        for sub in os.scandir(self.cache_dir):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith(".jpg"):
+                    st = entry.stat()
+                    yield entry.path, st.st_mtime, st.st_size
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total = sum(e[2] for e in entries)
+        target = self.max_bytes * 0.9
+        for path, _, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._total = total
@@ -0,0 +1,151 @@
+"""
+tracker.py
+
+Lightweight multi-object tracker for the webcam counters: run the detector every
+N frames and track boxes in between.
+
+Requirements:
+  pip install opencv-python numpy
+  (optional) pip install opencv-contrib-python   # KCF / MOSSE / CSRT trackers
+
+How it works (summary):
+  - On detection frames, update() matches detections to the current tracks by IoU
+    (highest IoU first). Matched tracks take the detected box, unmatched detections
+    start new tracks, and tracks missed by more than max_misses detection rounds are dropped.
+  - On the frames in between, predict() moves every track: with an OpenCV tracker
+    backend ("kcf", "mosse", "csrt") each track runs its own cv2 tracker; with the
+    "iou" backend (always available) boxes keep moving at their last measured velocity.
+  - A track gets an id once it has been detected min_hits times. Ids are stable, so
+    unique_count is the number of people seen over time rather than per-frame flicker.
+"""
+
+import cv2
+import numpy as np
+
+from boxes import as_boxes, iou_matrix
+
+_CV2_TRACKERS = {"kcf": "TrackerKCF_create", "mosse": "TrackerMOSSE_create", "csrt": "TrackerCSRT_create"}
+
+
+def make_cv2_tracker(kind):
+    """A new OpenCV tracker of `kind`, or None if this OpenCV build does not have it."""
+    name = _CV2_TRACKERS.get(kind)
+    if name is None:
+        raise ValueError(f"Unknown tracker backend: {kind}")
+    # MOSSE (and in newer builds KCF) only exist in the contrib "legacy" module
+    for module in (cv2, getattr(cv2, "legacy", None)):
+        factory = getattr(module, name, None)
+        if factory is not None:
+            return factory()
+    return None
+
+
+def available_backend(preferred="kcf"):
+    """`preferred` if this OpenCV build provides it, otherwise the pure IoU tracker."""
+    if preferred != "iou" and make_cv2_tracker(preferred) is not None:
+        return preferred
+    return "iou"
+
+
+class MultiTracker:
+    """
+    Track state lives in parallel NumPy arrays (one row per track), and the confirmed
+    tracks are published after every update() / predict() as `ids` (N,) and `boxes`
+    (N, 4) int32, so callers scale and draw from arrays rather than per-box tuples.
+    """
+
+    def __init__(self, backend="iou", iou_thresh=0.3, max_misses=2, min_hits=2):
+        self.backend = backend
+        self.iou_thresh = iou_thresh
+        self.max_misses = max_misses
+        self.min_hits = min_hits
+        self._boxes = np.empty((0, 4))              # (x, y, w, h), float so motion can be fractional
+        self._detected = np.empty((0, 4))           # box at the last detection
+        self._velocity = np.empty((0, 2))           # x/y pixels per frame
+        self._hits = np.empty(0, dtype=np.int64)
+        self._misses = np.empty(0, dtype=np.int64)
+        self._since_detect = np.empty(0, dtype=np.int64)
+        self._ids = np.empty(0, dtype=np.int64)     # 0 until the track is confirmed
+        self._cv_trackers = []                      # OpenCV tracker per track, or None
+        self.unique_count = 0
+        self.ids = np.empty(0, dtype=np.int64)      # confirmed tracks only
+        self.boxes = as_boxes([])
+
+    def update(self, frame, boxes):
+        """Feed the detections of `frame`. `frame` is only used by the OpenCV backends."""
+        boxes = as_boxes(boxes)
+        n = len(self._ids)
+        matched_tracks, matched_boxes = [], []
+        if n and len(boxes):
+            current = as_boxes(np.rint(self._boxes))
+            iou = iou_matrix(np.vstack([current, boxes]))[:n, n:]
+            pairs = np.argwhere(iou > self.iou_thresh)
+            pairs = pairs[np.argsort(-iou[pairs[:, 0], pairs[:, 1]], kind="stable")]
+            for ti, bi in pairs.tolist():
+                if ti in matched_tracks or bi in matched_boxes:
+                    continue
+                matched_tracks.append(ti)
+                matched_boxes.append(bi)
+
+        ti = np.array(matched_tracks, dtype=np.int64)
+        if len(ti):
+            measured = boxes[matched_boxes].astype(np.float64)
+            steps = np.maximum(1, self._since_detect[ti])
+            self._velocity[ti] = (measured[:, :2] - self._detected[ti, :2]) / steps[:, None]
+            self._boxes[ti] = measured
+            self._detected[ti] = measured
+            self._hits[ti] += 1
+        missed = np.ones(n, dtype=bool)
+        missed[ti] = False
+        self._misses[missed] += 1
+        self._misses[ti] = 0
+        self._since_detect[ti] = 0
+
+        # drop tracks missed too often, then start a track for every unmatched detection
+        keep = self._misses <= self.max_misses
+        new = np.delete(boxes, matched_boxes, axis=0).astype(np.float64)
+        k = len(new)
+        self._boxes = np.concatenate([self._boxes[keep], new])
+        self._detected = np.concatenate([self._detected[keep], new])
+        self._velocity = np.concatenate([self._velocity[keep], np.zeros((k, 2))])
+        self._hits = np.concatenate([self._hits[keep], np.ones(k, dtype=np.int64)])
+        self._misses = np.concatenate([self._misses[keep], np.zeros(k, dtype=np.int64)])
+        self._since_detect = np.concatenate([self._since_detect[keep], np.zeros(k, dtype=np.int64)])
+        self._ids = np.concatenate([self._ids[keep], np.zeros(k, dtype=np.int64)])
+        self._cv_trackers = [t for t, kept in zip(self._cv_trackers, keep.tolist()) if kept] + [None] * k
+
+        confirm = (self._ids == 0) & (self._hits >= self.min_hits)
+        n_new = int(np.count_nonzero(confirm))
+        self._ids[confirm] = np.arange(self.unique_count + 1, self.unique_count + 1 + n_new)
+        self.unique_count += n_new
+
+        if self.backend != "iou" and frame is not None:
+            rounded = as_boxes(np.rint(self._boxes))
+            for i in np.flatnonzero(self._misses == 0).tolist():
+                tracker = make_cv2_tracker(self.backend)
+                if tracker is not None:
+                    tracker.init(frame, tuple(rounded[i].tolist()))
+                self._cv_trackers[i] = tracker
+        self._publish()
+
+    def predict(self, frame=None):
+        """Move every track to `frame` without running the detector."""
+        self._since_detect += 1
+        coast = np.ones(len(self._ids), dtype=bool)   # tracks moved by the motion model
+        if frame is not None:
+            for i, tracker in enumerate(self._cv_trackers):
+                if tracker is None:
+                    continue
+                ok, box = tracker.update(frame)
+                if ok:
+                    self._boxes[i] = box
+                    coast[i] = False
+                else:
+                    self._cv_trackers[i] = None     # lost: fall back to the motion model
+        self._boxes[coast, :2] += self._velocity[coast]
+        self._publish()
+
+    def _publish(self):
+        confirmed = self._ids > 0
+        self.ids = self._ids[confirmed]
+        self.boxes = as_boxes(np.rint(self._boxes[confirmed]))